@@ -0,0 +1,72 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Copy of many small files and of one large file (user-011): one
+'cp -ra --parents' per entry, as in the baseline, against the Copier.
+The trees are created in a temporary folder of the current directory, so
+run it on the filesystem to measure.
+
+Usage: python3 bench/copy_files.py [number of 4 kB files] [large file size in MB]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import dirname, abspath, join
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from foldersynclib.copie import Copier  # noqa: E402
+
+
+def make_tree(orig, nb_files, large_size):
+    files = []
+    for k in range(nb_files):
+        folder = join(orig, "d%02d" % (k // 1000))
+        if not k % 1000:
+            os.makedirs(folder)
+        path = join(folder, "f%04d" % (k % 1000))
+        with open(path, "wb") as f:
+            f.write(os.urandom(4096))
+        files.append(path)
+    os.makedirs(join(orig, "big"))
+    with open(join(orig, "big", "f"), "wb") as f:
+        for i in range(large_size):
+            f.write(os.urandom(1024 * 1024))
+    return files
+
+
+def main(nb_files=20000, large_size=256):
+    with tempfile.TemporaryDirectory(dir=os.getcwd()) as tmp:
+        orig = join(tmp, "o")
+        files = make_tree(orig, nb_files, large_size)
+        for method in ("cp", "Copier"):
+            sauve = join(tmp, method)
+            os.makedirs(sauve)
+            os.sync()
+            t = time.perf_counter()
+            if method == "cp":
+                for path in files:
+                    subprocess.run(["cp", "-ra", "--parents",
+                                    path[len(orig) + 1:], sauve + "/"],
+                                   cwd=orig, check=True)
+            else:
+                copier = Copier(orig + "/", sauve + "/")
+                for path in files:
+                    copier.copy(path)
+            t_small = time.perf_counter() - t
+            t = time.perf_counter()
+            if method == "cp":
+                subprocess.run(["cp", "-ra", "--parents", "big/f", sauve + "/"],
+                               cwd=orig, check=True)
+            else:
+                copier.copy(join(orig, "big", "f"))
+            print("%-6s %i x 4 kB files %.2f s, one %i MB file %.2f s"
+                  % (method, nb_files, t_small, large_size,
+                     time.perf_counter() - t))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:3]])
@@ -0,0 +1,72 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Memory (RSS growth) and build time of a diff tree (user-009), for the
+current DiffTree ("new") or the one before user-009 ("old"), with file
+names repeated in each folder or unique. The files are in folders of 1000
+entries. Each measure runs in its own process.
+
+Usage: python3 bench/diff_memory.py [entries...]
+       python3 bench/diff_memory.py old|new entries repeated|unique
+"""
+
+import gc
+import subprocess
+import sys
+import time
+from os.path import dirname, abspath
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+PER_FOLDER = 1000
+
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4096
+
+
+def measure(which, n, unique):
+    if which == "old":
+        from old_diff import DiffTree, FILE, DIR, WHOLE
+    else:
+        from foldersynclib.diff import DiffTree, FILE, DIR, WHOLE
+    gc.collect()
+    r0 = rss()
+    t = time.perf_counter()
+    tree = DiffTree("/home/user/projects/original")
+    k = 0
+    for d in range(n // PER_FOLDER):
+        tree.enter("dir%05d" % d, DIR, WHOLE)
+        for f in range(PER_FOLDER):
+            if unique:
+                tree.add("file%07d.txt" % k, FILE, WHOLE)
+            else:
+                tree.add("file%04d.txt" % f, FILE, WHOLE)
+            k += 1
+        tree.leave()
+    t = time.perf_counter() - t
+    gc.collect()
+    return (rss() - r0) / 1e6, t
+
+
+def main(sizes):
+    print("entries  names     before           after")
+    for n in sizes:
+        for names in ("repeated", "unique"):
+            res = []
+            for which in ("old", "new"):
+                out = subprocess.run([sys.executable, __file__, which, str(n),
+                                      names], capture_output=True, text=True,
+                                     check=True).stdout.split()
+                res.append("%.0f MB / %.1f s" % (float(out[0]), float(out[1])))
+            print("%-8s %-9s %-16s %s" % ("%iM" % (n // 1000000), names, *res))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4:
+        sys.path.insert(0, dirname(abspath(__file__)))
+        print("%f %f" % measure(sys.argv[1], int(sys.argv[2]),
+                                sys.argv[3] == "unique"))
+    else:
+        main([int(a) for a in sys.argv[1:]] or [1000000, 5000000])
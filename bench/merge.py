@@ -0,0 +1,76 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Comparison of two folder listings (user-004): list membership tests of the
+baseline against the sort-merge of the Scanner, on synthetic listings with
+~90% of common names (no I/O).
+
+Usage: python3 bench/merge.py [sizes...]
+The quadratic version is only run up to 100k entries.
+"""
+
+import random
+import sys
+import time
+from os.path import dirname, abspath
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from foldersynclib.scan import merge, get_name  # noqa: E402
+
+MAX_QUADRATIC = 100000
+
+
+class Entry:
+    """Stand-in for os.DirEntry."""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
+def listings(n):
+    names = ["File_%07d.txt" % i for i in range(n)]
+    lo = [name for name in names if random.random() < 0.95]
+    ls = [name for name in names if random.random() < 0.95]
+    return lo, ls
+
+
+def membership(lo, ls):
+    """Baseline: 'item not in ls' for each entry of each side."""
+    lo.sort(key=lambda x: x.lower())
+    ls.sort(key=lambda x: x.lower())
+    res = [item for item in ls if item not in lo]
+    res.extend(item for item in lo if item not in ls)
+    return res
+
+
+def sort_merge(lo, ls):
+    lo = sorted(map(Entry, lo), key=get_name)
+    ls = sorted(map(Entry, ls), key=get_name)
+    return [pair for pair in merge(lo, ls) if None in pair]
+
+
+def main(sizes):
+    random.seed(0)
+    print("entries   list membership   merge")
+    for n in sizes:
+        lo, ls = listings(n)
+        if n <= MAX_QUADRATIC:
+            t = time.perf_counter()
+            membership(list(lo), list(ls))
+            old = "%.3f s" % (time.perf_counter() - t)
+        else:
+            old = "(not run)"
+        t = time.perf_counter()
+        sort_merge(lo, ls)
+        if n >= 1000000:
+            label = "%iM" % (n // 1000000)
+        else:
+            label = "%ik" % (n // 1000)
+        print("%-9s %-17s %.3f s" % (label, old, time.perf_counter() - t))
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10000, 100000, 1000000])
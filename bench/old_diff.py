@@ -0,0 +1,118 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Diff model before user-009 (one object with a full path per entry), kept
+only as the reference of bench/diff_memory.py.
+"""
+
+from os.path import join
+
+# --- entry kinds
+FILE = "file"
+DIR = "dir"
+LINK = "link"
+
+# --- entry states
+PARTIAL = "partial"      # folder containing some entries to copy / delete
+WHOLE = "whole"          # new entry, copied / deleted entirely
+MODIFIED = "modified"    # file modified since the last backup
+CONFLICT = "conflict"    # not of the same kind on the original and the backup
+
+
+class DiffEntry:
+    """Entry of a DiffTree."""
+
+    __slots__ = ("path", "parent", "name", "kind", "state", "depth")
+
+    def __init__(self, path, parent, name, kind, state, depth):
+        self.path = path
+        self.parent = parent
+        self.name = name
+        self.kind = kind
+        self.state = state
+        self.depth = depth
+
+    def tags(self):
+        """Return the treeview tags corresponding to the entry."""
+        if self.state == PARTIAL:
+            return ()
+        tags = ("whole",)
+        if self.state == CONFLICT:
+            tags += ("warning",)
+        if self.kind == LINK:
+            tags += ("link",)
+        return tags
+
+
+class DiffTree:
+    """
+    Entries to copy (or to delete) below root, in depth-first order so that
+    each parent comes before its children.
+
+    Folders are entered with enter() and left with leave(). They are only
+    added to the tree once one of their descendants is, so empty branches
+    never appear in entries.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.entries = []
+        # folders that have been entered, with a flag telling whether they
+        # are already in entries
+        self._stack = [[DiffEntry(root, "", root, DIR, PARTIAL, 0), False]]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def _flush(self):
+        """Add the folders entered so far to entries."""
+        for elt in self._stack:
+            if not elt[1]:
+                self.entries.append(elt[0])
+                elt[1] = True
+
+    def current(self):
+        """Return the path of the current folder."""
+        return self._stack[-1][0].path
+
+    def enter(self, name, kind=DIR, state=PARTIAL):
+        """Enter folder name of the current folder."""
+        parent = self._stack[-1][0]
+        entry = DiffEntry(join(parent.path, name), parent.path, name, kind,
+                          state, parent.depth + 1)
+        self._stack.append([entry, False])
+        if state != PARTIAL:
+            self._flush()
+        return entry
+
+    def leave(self):
+        """Go back to the parent folder."""
+        self._stack.pop()
+
+    def add(self, name, kind, state):
+        """Add entry name of the current folder."""
+        self._flush()
+        parent = self._stack[-1][0]
+        entry = DiffEntry(join(parent.path, name), parent.path, name, kind,
+                          state, parent.depth + 1)
+        self.entries.append(entry)
+        return entry
+
+    def conflicts(self):
+        """Return the list of paths that are not of the same kind on both sides."""
+        return [e.path for e in self.entries if e.state == CONFLICT]
+
+
+class Diff:
+    """Result of the comparison of original and sauvegarde."""
+
+    def __init__(self, original, sauvegarde):
+        self.original = original
+        self.sauvegarde = sauvegarde
+        self.copie = DiffTree(original)
+        self.supp = DiffTree(sauvegarde)
+        self.errors = []
+        self.cancelled = False
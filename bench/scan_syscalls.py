@@ -0,0 +1,116 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Number of directory listings and stats of a scan of two identical trees
+(user-003).
+
+"before" replays the calls made per entry by the scan of the baseline
+(listdir() on both sides, then islink / isfile / getmtime on the paths),
+"after" runs the Scanner.
+
+Usage: python3 bench/scan_syscalls.py [folders] [files per folder]
+"""
+
+import os
+import sys
+import tempfile
+from collections import Counter
+from os.path import dirname, abspath, join, islink, isfile, isdir, getmtime
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+import foldersynclib.scan as scan  # noqa: E402
+
+calls = Counter()
+
+
+def counted(name, func):
+    def wrapper(*args, **kw):
+        calls[name] += 1
+        return func(*args, **kw)
+    return wrapper
+
+
+class Entry:
+    """DirEntry counting the calls to stat()."""
+
+    def __init__(self, entry):
+        self._entry = entry
+        self.name = entry.name
+        self.path = entry.path
+
+    def __getattr__(self, name):
+        return getattr(self._entry, name)
+
+    def stat(self, follow_symlinks=True):
+        calls["DirEntry.stat"] += 1
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+    def __fspath__(self):
+        return self.path
+
+
+class Scandir:
+    def __init__(self, path):
+        calls["scandir"] += 1
+        self._it = os.scandir(path)
+
+    def __enter__(self):
+        return (Entry(e) for e in self._it)
+
+    def __exit__(self, *args):
+        self._it.close()
+
+
+def make_tree(root, folders, files):
+    for d in range(folders):
+        path = join(root, "d%03d" % d)
+        os.makedirs(path)
+        for f in range(files):
+            with open(join(path, "f%03d" % f), "w") as fh:
+                fh.write("x")
+
+
+def before(orig, sauve):
+    """Calls of the scan of the baseline, without the tree widgets."""
+    lo = os.listdir(orig)
+    ls = os.listdir(sauve)
+    for item in lo:
+        chemin_o = join(orig, item)
+        chemin_s = join(sauve, item)
+        if item not in ls:
+            continue
+        if islink(chemin_o):
+            continue
+        elif isfile(chemin_o):
+            if isfile(chemin_s):
+                getmtime(chemin_o) // 60 > getmtime(chemin_s) // 60
+        elif isdir(chemin_o) and isdir(chemin_s):
+            before(chemin_o, chemin_s)
+
+
+def main(folders=100, files=100):
+    with tempfile.TemporaryDirectory() as tmp:
+        orig = join(tmp, "original")
+        sauve = join(tmp, "backup")
+        make_tree(orig, folders, files)
+        make_tree(sauve, folders, files)
+        real_stat, real_lstat, real_listdir = os.stat, os.lstat, os.listdir
+        os.stat = counted("stat", real_stat)
+        os.lstat = counted("lstat", real_lstat)
+        os.listdir = counted("listdir", real_listdir)
+        try:
+            before(orig, sauve)
+            print("before:", dict(calls))
+            calls.clear()
+            scan.scandir = Scandir
+            scan.stat = counted("stat", real_stat)
+            scan.lstat = counted("lstat", real_lstat)
+            scan.Scanner().scan(orig, sauve)
+            print("after: ", dict(calls))
+        finally:
+            os.stat, os.lstat, os.listdir = real_stat, real_lstat, real_listdir
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:3]])
@@ -0,0 +1,96 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Check state model and bulk insertion of CheckboxTreeview on a folder of
+200k files (user-023, user-024, user-025).
+
+The benchmarks do not need a display: the treeview is a Tcl procedure
+counting its calls in a plain Tcl interpreter, and the Treeview methods
+that would query it are replaced by Python equivalents, so the times are
+the ones of the Python side and of the Tcl calls, not of the drawing.
+
+Usage: python3 bench/tree_model.py [number of files]
+"""
+
+import sys
+import time
+from collections import defaultdict
+from os.path import dirname, abspath
+from tkinter import Tcl
+from tkinter.ttk import Treeview
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from foldersynclib.checkboxtreeview import CheckboxTreeview  # noqa: E402
+
+
+def fake_tree(children):
+    """Return a CheckboxTreeview drawing nothing."""
+    tcl = Tcl()
+    tcl.eval("proc w {args} {incr ::calls; return 0}")
+    Treeview.get_children = lambda self, item="": tuple(children[item])
+    Treeview.item = lambda self, item, option=None, **kw: ()
+    Treeview.delete = lambda self, *items: None
+    tree = CheckboxTreeview.__new__(CheckboxTreeview)
+    tree.tk = tcl
+    tree._w = "w"
+    tree._schedule_refresh = lambda *args: None
+    tree._reset_model()
+    return tree
+
+
+def main(n=200000):
+    children = defaultdict(list)
+    tree = fake_tree(children)
+    rows = [("", "r", "folder", ("checked",))]
+    rows.extend(("r", "c%i" % k, "file_%i.txt" % k, ("whole",))
+                for k in range(n))
+    for parent, iid, text, tags in rows:
+        children[parent].append(iid)
+
+    # --- user-025: insertion
+    tcl = tree.tk
+    t = time.perf_counter()
+    for parent, iid, text, tags in rows:
+        tcl.call("w", "tag", "has", "checked", parent)
+        Treeview.insert(tree, parent, "end", iid, text=text, tags=tags)
+    t_old = time.perf_counter() - t
+    t = time.perf_counter()
+    tree.insert_many(rows)
+    print("insert %i rows: tag_has + Treeview.insert per row %.2f s, "
+          "insert_many %.2f s" % (n, t_old, time.perf_counter() - t))
+
+    # --- user-023: clicks
+    t = time.perf_counter()
+    for i in range(100):
+        tree.set_check_state("r", "unchecked")
+        tree.set_check_state("c5", "checked")
+        tree.set_check_state("r", "checked")
+    print("300 clicks on the folder and one of its files: %.4f s"
+          % (time.perf_counter() - t))
+
+    # --- user-024: selection
+    tree.set_check_state("r", "unchecked")
+    for k in range(0, n, 1000):
+        tree.set_check_state("c%i" % k, "checked")
+
+    def full_walk(item):
+        state = tree.check_state(item)
+        if state == "checked" and item != "r":
+            selected.append(item)
+        elif state != "unchecked":
+            for c in children[item]:
+                full_walk(c)
+
+    t = time.perf_counter()
+    checked = tree.get_checked(lambda item: item != "r")
+    t_new = time.perf_counter() - t
+    selected = []
+    t = time.perf_counter()
+    full_walk("r")
+    print("selection of %i files: get_checked %.5f s, walk of the whole "
+          "model %.5f s" % (len(checked), t_new, time.perf_counter() - t))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:2]])
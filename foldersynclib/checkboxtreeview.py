@@ -26,15 +26,44 @@ from tkinter.ttk import Treeview, Style
 from foldersynclib.constants import IM_CHECKED, IM_UNCHECKED, IM_TRISTATE
 
 
+STATES = ("checked", "unchecked", "tristate")
+# Tcl procedure inserting a flat list of parent, iid, text, tags in a treeview
+INSERT_MANY = """{w rows} {
+    foreach {parent iid text tags} $rows {
+        $w insert $parent end -id $iid -text $text -tags $tags
+    }
+}"""
+
+
 class CheckboxTreeview(Treeview):
     """
         Treeview widget with checkboxes left of each item.
         The checkboxes are done via the image attribute of the item, so to keep
         the checkbox, you cannot add an image to the item.
+
+        The children of an item can be inserted lazily: insert_placeholder()
+        gives the item a temporary child so that it can be opened, and the
+        populate(item) function is called to insert the real children the
+        first time the item is opened. They take the check state of the item.
+
+        The <<CheckboxToggled>> event is generated when the user clicks a box.
+
+        The check states are kept in a Python model, read them with
+        check_state() and not from the tags: each item stores its own state
+        and the number of its checked and unchecked children, and checking
+        an item only marks its subtree as checked (with a stamp, a subtree
+        mark is overridden by the more recent states of the items below).
+        Clicking a box thus costs O(depth) whatever the size of the
+        subtree, and only the tags of the rows on screen are refreshed.
     """
 
-    def __init__(self, master=None, **kw):
+    def __init__(self, master=None, populate=None, **kw):
+        yscrollcommand = kw.pop("yscrollcommand", None)
         Treeview.__init__(self, master, style='Checkbox.Treeview', **kw)
+        self.populate = populate
+        self._reset_model()
+        self._refresh_id = None
+        self.configure(yscrollcommand=yscrollcommand)
         # style (make a noticeable disabled style)
         style = Style(self)
         style.map("Checkbox.Treeview",
@@ -50,9 +79,69 @@ class CheckboxTreeview(Treeview):
         self.tag_configure("checked", image=self.im_checked)
         # check / uncheck boxes on click
         self.bind("<Button-1>", self.box_click, True)
+        # insert the children of lazy items when they are opened
+        self.bind("<<TreeviewOpen>>", self._on_open, True)
+        self.bind("<Configure>", self._schedule_refresh, True)
+
+    def configure(self, cnf=None, **kw):
+        # the rows on screen change with the view, their tags are refreshed
+        cmd = kw.get("yscrollcommand")
+        if cmd is not None:
+            def yscrollcommand(*args):
+                cmd(*args)
+                self._schedule_refresh()
+            kw["yscrollcommand"] = yscrollcommand
+        elif "yscrollcommand" in kw:
+            kw["yscrollcommand"] = self._schedule_refresh
+        return Treeview.configure(self, cnf, **kw)
+
+    config = configure
+
+    def insert_placeholder(self, item):
+        """ give item a placeholder child, its children will be inserted by
+            populate(item) when it is opened """
+        item = str(item)
+        self._lazy.add(item)
+        self.insert(item, "end", item + "-", text="")
+
+    def fill(self, item):
+        """ insert the children of item if they have not been inserted yet """
+        item = str(item)
+        if item in self._lazy:
+            self._lazy.remove(item)
+            self._forget(item + "-")
+            Treeview.delete(self, item + "-")
+            self.populate(item)
+
+    def _on_open(self, event):
+        # the opened item is given the focus before the event is generated
+        self.fill(self.focus())
+        self._schedule_refresh()
+
+    def _reset_model(self):
+        # items whose children have not been inserted yet
+        self._lazy = set()
+        # --- check state model
+        self._parent = {}     # item -> parent
+        self._nb_children = {"": 0}
+        # item -> [state, checked children, unchecked children, stamp]
+        self._own = {"": ["checked", 0, 0, 0]}
+        # item -> (state, stamp) of its whole subtree
+        self._subtree = {}
+        # tristate item -> (True, children not unchecked) or
+        #                  (False, unchecked children)
+        self._mixed = {}
+        self._stamp = 0
+        self._shown = {}      # item -> state displayed by its tags
+
+    def clear(self):
+        """ delete all items """
+        self._reset_model()
+        Treeview.delete(self, *self.get_children(""))
 
     def expand_all(self):
         def aux(item):
+            self.fill(item)
             self.item(item, open=True)
             children = self.get_children(item)
             for c in children:
@@ -86,10 +175,10 @@ class CheckboxTreeview(Treeview):
         """ replace the current state of the item
             (ie replace the current state tag but keeps the other tags) """
         tags = self.item(item, "tags")
-        states = ("checked", "unchecked", "tristate")
-        new_tags = [t for t in tags if not t in states]
+        new_tags = [t for t in tags if t not in STATES]
         new_tags.append(state)
         self.item(item, tags=tuple(new_tags))
+        self._shown[item] = state
 
     def tag_add(self, item, tag):
         """ add tag to the tags of item """
@@ -107,69 +196,235 @@ class CheckboxTreeview(Treeview):
         """ same method as for standard treeview but add the tag for the box
             state accordingly to the parent state if no tag among
             ('checked', 'unchecked', 'tristate') is given """
-        if self.tag_has("checked", parent):
-            tag = "checked"
-        else:
-            tag = 'unchecked'
-        if not "tags" in kw:
-            kw["tags"] = (tag,)
-        elif not ("unchecked" in kw["tags"] or "checked" in kw["tags"]
-                  or "tristate" in kw["tags"]):
-            kw["tags"] += (tag,)
-
-        Treeview.insert(self, parent, index, iid, **kw)
-
-    def check_descendant(self, item):
-        """ check the boxes of item's descendants """
-        children = self.get_children(item)
-        for iid in children:
-            self.change_state(iid, "checked")
-            self.check_descendant(iid)
-
-    def check_ancestor(self, item):
-        """ check the box of item and change the state of the boxes of item's
-            ancestors accordingly """
-        self.change_state(item, "checked")
-        parent = self.parent(item)
-        if parent:
-            children = self.get_children(parent)
-            b = ["checked" in self.item(c, "tags") for c in children]
-            if False in b:
-                # at least one box is not checked and item's box is checked
-                self.tristate_parent(parent)
+        parent = str(parent)
+        state, kw["tags"] = self._box_tags(self.check_state(parent),
+                                           kw.get("tags", ()))
+        item = Treeview.insert(self, parent, index, iid, **kw)
+        self._add(parent, item, state)
+        return item
+
+    def insert_many(self, rows, lazy=()):
+        """ insert at the end of their parent the items given as
+            (parent, iid, text, tags) rows, the parents being inserted
+            before their children, then a placeholder child in the items of
+            lazy (see insert_placeholder), with a single Tcl call """
+        states = {}
+        args = []
+        for parent, iid, text, tags in rows:
+            parent, iid = str(parent), str(iid)
+            parent_state = states.get(parent)
+            if parent_state is None:
+                parent_state = self.check_state(parent)
+            state, tags = self._box_tags(parent_state, tags)
+            self._add(parent, iid, state)
+            states[iid] = state
+            args.extend((parent, iid, text, tags))
+        for item in lazy:
+            item = str(item)
+            self._lazy.add(item)
+            state, tags = self._box_tags(self.check_state(item), ())
+            self._add(item, item + "-", state)
+            args.extend((item, item + "-", "", tags))
+        if args:
+            self.tk.call("apply", INSERT_MANY, self._w, args)
+
+    @staticmethod
+    def _box_tags(parent_state, tags):
+        """ return the state and the tags of a new child of an item in
+            parent_state """
+        given = [t for t in tags if t in STATES]
+        if given:
+            return given[0], tuple(tags)
+        state = "checked" if parent_state == "checked" else "unchecked"
+        return state, tuple(tags) + (state,)
+
+    def _add(self, parent, item, state):
+        """ add item, child of parent, to the model """
+        # the state of the parent is not changed by the insertion
+        self._materialize(parent)
+        self._nb_children[parent] += 1
+        self._child_changed(parent, item, None, state)
+        if state == "tristate":
+            self._mixed[item] = (True, set())
+        self._stamp += 1
+        self._parent[item] = parent
+        self._nb_children[item] = 0
+        self._own[item] = [state, 0, 0, self._stamp]
+        self._shown[item] = state
+
+    def _forget(self, item):
+        """ remove leaf item from the model """
+        parent = self._parent.pop(item)
+        state = self.check_state(item)
+        self._materialize(parent)
+        self._nb_children[parent] -= 1
+        self._child_changed(parent, item, state, None)
+        del self._own[item], self._nb_children[item]
+        self._subtree.pop(item, None)
+        self._mixed.pop(item, None)
+        self._shown.pop(item, None)
+
+    # --- check state model
+    def _ancestors(self, item):
+        """ return the ancestors of item, from the top level one to its
+            parent """
+        ancestors = []
+        parent = self._parent.get(item, "")
+        while parent:
+            ancestors.append(parent)
+            parent = self._parent[parent]
+        ancestors.reverse()
+        return ancestors
+
+    def _inherited(self, ancestors):
+        """ return the most recent (state, stamp) given to the subtree of
+            one of ancestors """
+        mark = (None, -1)
+        for a in ancestors:
+            m = self._subtree.get(a)
+            if m is not None and m[1] > mark[1]:
+                mark = m
+        return mark
+
+    def check_state(self, item):
+        """ return the state of the box of item """
+        item = str(item)
+        own = self._own[item]
+        if not self._subtree:
+            return own[0]
+        mark = self._inherited(self._ancestors(item))
+        return mark[0] if mark[1] > own[3] else own[0]
+
+    def _materialize(self, item, ancestors=None):
+        """ store in item the state it inherits from its ancestors """
+        if not self._subtree or not item:
+            return
+        if ancestors is None:
+            ancestors = self._ancestors(item)
+        mark = self._inherited(ancestors)
+        own = self._own[item]
+        if mark[1] > own[3]:
+            n = self._nb_children[item]
+            own[:] = [mark[0], n if mark[0] == "checked" else 0,
+                      n if mark[0] == "unchecked" else 0, mark[1]]
+            # the children of item inherit it through its subtree mark
+            self._subtree[item] = mark
+            self._mixed.pop(item, None)
+
+    def _child_changed(self, parent, child, old, new):
+        """ update the counters of parent after the state of child changed
+            from old to new (None for an inserted / removed child) """
+        own = self._own[parent]
+        if old == "checked":
+            own[1] -= 1
+        elif old == "unchecked":
+            own[2] -= 1
+        if new == "checked":
+            own[1] += 1
+        elif new == "unchecked":
+            own[2] += 1
+        if own[0] == "tristate":
+            included, children = self._mixed[parent]
+            if new is not None and (new != "unchecked") == included:
+                children.add(child)
             else:
-                # all boxes of the children are checked
-                self.check_ancestor(parent)
-
-    def tristate_parent(self, item):
-        """ put the box of item in tristate and change the state of the boxes of
-            item's ancestors accordingly """
-        self.change_state(item, "tristate")
-        parent = self.parent(item)
-        if parent:
-            self.tristate_parent(parent)
-
-    def uncheck_descendant(self, item):
-        """ uncheck the boxes of item's descendant """
-        children = self.get_children(item)
-        for iid in children:
-            self.change_state(iid, "unchecked")
-            self.uncheck_descendant(iid)
-
-    def uncheck_ancestor(self, item):
-        """ uncheck the box of item and change the state of the boxes of item's
-            ancestors accordingly """
-        self.change_state(item, "unchecked")
-        parent = self.parent(item)
-        if parent:
-            children = self.get_children(parent)
-            b = ["unchecked" in self.item(c, "tags") for c in children]
-            if False in b:
-                # at least one box is checked and item's box is unchecked
-                self.tristate_parent(parent)
+                children.discard(child)
+
+    def set_check_state(self, item, state):
+        """ check (state 'checked') or uncheck (state 'unchecked') item and
+            its descendants and update the boxes of its ancestors """
+        item = str(item)
+        ancestors = self._ancestors(item)
+        for i, a in enumerate(ancestors):
+            self._materialize(a, ancestors[:i])
+        old = self.check_state(item)
+        self._stamp += 1
+        n = self._nb_children[item]
+        self._own[item] = [state, n if state == "checked" else 0,
+                           n if state == "unchecked" else 0, self._stamp]
+        self._subtree[item] = (state, self._stamp)
+        self._mixed.pop(item, None)
+        # update the counters of the ancestors while their state changes
+        child, new = item, state
+        for a in reversed(ancestors):
+            self._child_changed(a, child, old, new)
+            own = self._own[a]
+            n = self._nb_children[a]
+            if own[1] == n:
+                a_state = "checked"
+            elif own[2] == n:
+                a_state = "unchecked"
             else:
-                # no box is checked
-                self.uncheck_ancestor(parent)
+                a_state = "tristate"
+            if a_state == own[0]:
+                break
+            if a_state != "tristate":
+                self._mixed.pop(a, None)
+            elif own[0] == "unchecked":
+                self._mixed[a] = (True, {child} if new != "unchecked" else set())
+            else:
+                self._mixed[a] = (False, {child} if new == "unchecked" else set())
+            old, own[0], new, child = own[0], a_state, a_state, a
+        self._refresh(item)
+        for a in ancestors:
+            self._refresh(a)
+        self._schedule_refresh()
+
+    def get_checked(self, is_leaf):
+        """ return the checked items for which is_leaf(item) is true,
+            without their descendants; the descendants of the other items
+            are searched only where some boxes are checked """
+        checked = []
+        stack = [(c, (None, -1)) for c in self.get_children("")]
+        while stack:
+            item, mark = stack.pop()
+            own = self._own[item]
+            state = mark[0] if mark[1] > own[3] else own[0]
+            if state == "unchecked":
+                continue
+            if state == "checked":
+                if is_leaf(item):
+                    checked.append(item)
+                    continue
+                children = self.get_children(item)
+            else:
+                included, children = self._mixed[item]
+                if not included:
+                    unchecked = children
+                    children = [c for c in self.get_children(item)
+                                if c not in unchecked]
+            m = self._subtree.get(item)
+            if m is not None and m[1] > mark[1]:
+                mark = m
+            stack.extend((c, mark) for c in children)
+        return checked
+
+    def _refresh(self, item):
+        """ update the tags of item if they do not match its state """
+        state = self.check_state(item)
+        if self._shown.get(item) != state:
+            self.change_state(item, state)
+
+    def _schedule_refresh(self, *args):
+        if self._refresh_id is None:
+            self._refresh_id = self.after_idle(self._refresh_visible)
+
+    def _refresh_visible(self):
+        """ update the tags of the rows on screen """
+        self._refresh_id = None
+        height = self.winfo_height()
+        y = 0
+        while y < height:
+            item = self.identify_row(y)
+            if not item:
+                # heading or border
+                y += 1
+                continue
+            self._refresh(item)
+            bbox = self.bbox(item)
+            if not bbox:
+                break
+            y = max(y + 1, bbox[1] + bbox[3])
 
     def box_click(self, event):
         """ check or uncheck box when clicked """
@@ -178,9 +433,8 @@ class CheckboxTreeview(Treeview):
         if "image" in elem:
             # a box was clicked
             item = self.identify_row(y)
-            if self.tag_has("unchecked", item) or self.tag_has("tristate", item):
-                self.check_ancestor(item)
-                self.check_descendant(item)
+            if self.check_state(item) == "checked":
+                self.set_check_state(item, "unchecked")
             else:
-                self.uncheck_descendant(item)
-                self.uncheck_ancestor(item)
+                self.set_check_state(item, "checked")
+            self.event_generate("<<CheckboxToggled>>")
@@ -0,0 +1,135 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+FolderSync - Folder synchronization software
+Copyright 2017-2018 Juliette Monsel <j_4321@protonmail.com>
+
+FolderSync is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FolderSync is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+File comparison modes
+"""
+
+import sqlite3
+from hashlib import blake2b
+
+# --- comparison modes
+MTIME = "mtime"            # original newer than the backup (1 minute precision)
+SIZE_MTIME = "size_mtime"  # different size or mtime (with a tolerance)
+CHECKSUM = "checksum"      # different content
+
+MODES = (MTIME, SIZE_MTIME, CHECKSUM)
+
+# mtimes are compared with a one minute precision in MTIME mode
+MTIME_PRECISION = 60000000000
+
+# maximum number of checksums kept in the cache
+MAX_HASHES = 1000000
+
+BUFFER_SIZE = 1024 * 1024
+
+
+def checksum(path):
+    """Return the BLAKE2 digest of the content of path."""
+    h = blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        buf = bytearray(BUFFER_SIZE)
+        view = memoryview(buf)
+        n = f.readinto(buf)
+        while n:
+            h.update(view[:n])
+            n = f.readinto(buf)
+    return h.digest()
+
+
+class HashCache:
+    """
+    Persistent cache of file checksums, keyed by
+    (device, inode, size, mtime_ns) so that unchanged files are not read
+    again.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.filename)
+            self._db.execute("CREATE TABLE IF NOT EXISTS hashes "
+                             "(dev INTEGER, ino INTEGER, size INTEGER, "
+                             "mtime INTEGER, digest BLOB, "
+                             "PRIMARY KEY (dev, ino, size, mtime))")
+        return self._db
+
+    def checksum(self, path, st):
+        """Return the checksum of path (st is its stat result)."""
+        db = self._connect()
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        row = db.execute("SELECT digest FROM hashes WHERE dev=? AND ino=? "
+                         "AND size=? AND mtime=?", key).fetchone()
+        if row is not None:
+            return row[0]
+        digest = checksum(path)
+        db.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+                   key + (digest,))
+        return digest
+
+    def close(self):
+        """Commit the new checksums and forget the oldest ones."""
+        if self._db is not None:
+            with self._db:
+                self._db.execute("DELETE FROM hashes WHERE rowid <= "
+                                 "(SELECT MAX(rowid) FROM hashes) - ?",
+                                 (MAX_HASHES,))
+            self._db.close()
+            self._db = None
+
+
+class Comparator:
+    """
+    Decide whether a file of the original has to be copied over its backup.
+
+    mode: one of MODES
+    tolerance: maximum mtime difference (in ns) in SIZE_MTIME mode
+    hash_file: path of the HashCache database used in CHECKSUM mode
+    """
+
+    def __init__(self, mode=MTIME, tolerance=0, hash_file=None):
+        if mode not in MODES:
+            raise ValueError("Unknown comparison mode %r" % mode)
+        self.mode = mode
+        self.tolerance = tolerance
+        if mode == CHECKSUM:
+            self.hashes = HashCache(hash_file or ":memory:")
+        else:
+            self.hashes = None
+
+    def is_modified(self, path_o, st_o, path_s, st_s):
+        """
+        Return True if file path_o is to be copied over path_s
+        (st_o and st_s are their stat results).
+        """
+        if self.mode == MTIME:
+            return (st_o.st_mtime_ns // MTIME_PRECISION >
+                    st_s.st_mtime_ns // MTIME_PRECISION)
+        if st_o.st_size != st_s.st_size:
+            return True
+        if self.mode == SIZE_MTIME:
+            return abs(st_o.st_mtime_ns - st_s.st_mtime_ns) > self.tolerance
+        return (self.hashes.checksum(path_o, st_o) !=
+                self.hashes.checksum(path_s, st_s))
+
+    def close(self):
+        if self.hashes is not None:
+            self.hashes.close()
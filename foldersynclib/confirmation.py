@@ -21,22 +21,134 @@ Sync confirmation
 """
 
 
-from tkinter import Toplevel, Text
-from tkinter.ttk import Button, Label, PanedWindow, Style, Frame
-from foldersynclib.scrollbar import AutoScrollbar as Scrollbar
+from os.path import join
+from queue import Queue
+from threading import Thread
+from tkinter import Toplevel, StringVar, BooleanVar
+from tkinter.ttk import Button, Label, PanedWindow, Style, Frame, Entry, \
+    Checkbutton
 from foldersynclib.constants import convert_size
-from os import scandir
-from os.path import getsize
+from foldersynclib.progress import tree_size
+from foldersynclib.virtuallist import VirtualList
+
+# number of paths filtered between two updates of the display
+FILTER_CHUNK = 50000
+
+
+def aggregate(paths, sizes):
+    """
+    Return one row per folder containing some of paths, with the number
+    of these paths and their size (if known for all of them in sizes).
+    """
+    counts = {}
+    totals = {}
+    for path in paths:
+        folder = path.rpartition("/")[0] or "/"
+        counts[folder] = counts.get(folder, 0) + 1
+        size = sizes.get(path)
+        total = totals.get(folder, 0)
+        if size is None or total < 0:
+            totals[folder] = -1
+        else:
+            totals[folder] = total + size[1]
+    rows = []
+    for folder, nb in counts.items():
+        size = totals[folder]
+        if size < 0:
+            rows.append(_("%(folder)s  [%(nb)i entries]") % {'folder': join(folder, ""), 'nb': nb})
+        else:
+            rows.append(_("%(folder)s  [%(nb)i entries, %(size)s]") % {'folder': join(folder, ""), 'nb': nb, 'size': convert_size(size)})
+    return rows
+
+
+class PlanList(Frame):
+    """
+    Review of a list of paths: only the visible rows are displayed, the
+    list can be filtered (incrementally, without blocking the interface)
+    and grouped by folder.
+
+    sizes: path -> (number of files, size), for the folder rows
+    """
+
+    def __init__(self, master, paths, sizes, **kw):
+        Frame.__init__(self, master, **kw)
+        self.columnconfigure(1, weight=1)
+        self.rowconfigure(1, weight=1)
+        self.paths = paths
+        self.sizes = sizes
+        self._filtered = paths     # paths matching the filter
+        self._filter_text = ""     # filter of _filtered, once complete
+        self._job = None
+
+        self.filter = StringVar(self)
+        self.group = BooleanVar(self, False)
+        Label(self, text=_("Filter")).grid(row=0, column=0, padx=(0, 4), pady=4)
+        Entry(self, textvariable=self.filter).grid(row=0, column=1,
+                                                   sticky="ew", pady=4)
+        Checkbutton(self, text=_("Group by folder"), variable=self.group,
+                    command=self._display).grid(row=0, column=2, padx=4,
+                                                pady=4)
+        self.list = VirtualList(self, paths, style="text.TFrame",
+                                borderwidth=1)
+        self.list.grid(row=1, column=0, columnspan=3, sticky="eswn")
+        self.filter.trace_add("write", self._start_filter)
+
+    def _display(self, keep_position=False):
+        if self.group.get():
+            self.list.set_rows(aggregate(self._filtered, self.sizes))
+        else:
+            self.list.set_rows(self._filtered, keep_position)
+
+    def _start_filter(self, *args):
+        if self._job is not None:
+            self.after_cancel(self._job)
+            self._job = None
+        text = self.filter.get()
+        if self._filter_text is not None and text.startswith(self._filter_text):
+            # the new filter narrows the previous one
+            source = self._filtered
+        else:
+            source = self.paths
+        self._filter_text = None
+        if not text:
+            self._filtered = self.paths
+            self._filter_text = ""
+            self._display()
+            return
+        self._filtered = []
+        self._filter(source, text, 0)
+
+    def _filter(self, source, text, start):
+        end = start + FILTER_CHUNK
+        self._filtered.extend(path for path in source[start:end] if text in path)
+        if end < len(source):
+            if not self.group.get():
+                # the matches found so far are displayed at once
+                self._display(keep_position=start > 0)
+            self._job = self.after(1, self._filter, source, text, end)
+        else:
+            self._job = None
+            self._filter_text = text
+            self._display(keep_position=start > 0)
+
+    def destroy(self):
+        if self._job is not None:
+            self.after_cancel(self._job)
+            self._job = None
+        Frame.destroy(self)
 
 
 class Confirmation(Toplevel):
     """
     Confirmation window that recapitulate the changes that will be made
     during the synchronisation.
+
+    sizes: path -> (number of files, size) of the paths of a_copier and
+           a_supp whose size was recorded by the scan
     """
 
     def __init__(self, master, a_copier, a_supp, a_supp_avant_cp, original,
-                 sauvegarde, show_size):
+                 sauvegarde, show_size, sizes=None):
         Toplevel.__init__(self, master)
         self.geometry("%ix%i" % (self.winfo_screenwidth(),
                                  self.winfo_screenheight()))
@@ -48,8 +160,14 @@ class Confirmation(Toplevel):
         self.a_copier = a_copier
         self.a_supp = a_supp
         self.a_supp_avant_cp = a_supp_avant_cp
-
-        h = max(len(a_supp), len(a_copier))
+        # path -> (number of files, size), reused for the progress
+        self.sizes = dict(sizes or {})
+        self._q_size = Queue()
+        # total sizes of the files to copy / to delete known so far
+        self._total_copy = 0
+        self._total_supp = 0
+        self._poll_id = None
+        self._stop = False
 
         style = Style(self)
         style.configure("text.TFrame", background="white", relief="sunken")
@@ -69,23 +187,8 @@ class Confirmation(Toplevel):
         paned.add(frame_copie, weight=1)
         Label(frame_copie, text=_("To copy:")).grid(row=0, columnspan=2,
                                                     padx=(10, 4), pady=4)
-        f_copie = Frame(frame_copie, style="text.TFrame", borderwidth=1)
-        f_copie.columnconfigure(0, weight=1)
-        f_copie.rowconfigure(0, weight=1)
-        f_copie.grid(row=1, column=0, sticky="ewsn")
-        txt_copie = Text(f_copie, height=h, wrap="none",
-                         highlightthickness=0, relief="flat")
-        txt_copie.grid(row=0, column=0, sticky="eswn")
-        scrollx_copie = Scrollbar(frame_copie, orient="horizontal",
-                                  command=txt_copie.xview)
-        scrolly_copie = Scrollbar(frame_copie, orient="vertical",
-                                  command=txt_copie.yview)
-        scrollx_copie.grid(row=2, column=0, sticky="ew")
-        scrolly_copie.grid(row=1, column=1, sticky="ns")
-        txt_copie.configure(yscrollcommand=scrolly_copie.set,
-                            xscrollcommand=scrollx_copie.set)
-        txt_copie.insert("1.0", "\n".join(a_copier))
-        txt_copie.configure(state="disabled")
+        self.plan_copie = PlanList(frame_copie, a_copier, self.sizes)
+        self.plan_copie.grid(row=1, column=0, sticky="ewsn")
         self._size_copy = Label(frame_copie)
         self._size_copy.grid(row=3, column=0)
 
@@ -96,23 +199,8 @@ class Confirmation(Toplevel):
         paned.add(frame_supp, weight=1)
         Label(frame_supp, text=_("To remove:")).grid(row=0, columnspan=2,
                                                      padx=(4, 10), pady=4)
-        f_supp = Frame(frame_supp, style="text.TFrame", borderwidth=1)
-        f_supp.columnconfigure(0, weight=1)
-        f_supp.rowconfigure(0, weight=1)
-        f_supp.grid(row=1, column=0, sticky="ewsn")
-        txt_supp = Text(f_supp, height=h, wrap="none",
-                        highlightthickness=0, relief="flat")
-        txt_supp.grid(row=0, column=0, sticky="eswn")
-        scrollx_supp = Scrollbar(frame_supp, orient="horizontal",
-                                 command=txt_supp.xview)
-        scrolly_supp = Scrollbar(frame_supp, orient="vertical",
-                                 command=txt_supp.yview)
-        scrollx_supp.grid(row=2, column=0, sticky="ew")
-        scrolly_supp.grid(row=1, column=1, sticky="ns")
-        txt_supp.configure(yscrollcommand=scrolly_supp.set,
-                           xscrollcommand=scrollx_supp.set)
-        txt_supp.insert("1.0", "\n".join(a_supp))
-        txt_supp.configure(state="disabled")
+        self.plan_supp = PlanList(frame_supp, a_supp, self.sizes)
+        self.plan_supp.grid(row=1, column=0, sticky="ewsn")
         self._size_supp = Label(frame_supp)
         self._size_supp.grid(row=3, column=0)
 
@@ -129,35 +217,81 @@ class Confirmation(Toplevel):
             self.compute_size()
 
     def compute_size(self):
-        """Compute and display total size of files to copy/to delete."""
-        def size(path):
-            s = 0
+        """
+        Display the total size of the files to copy / to delete. The sizes
+        recorded by the scan are displayed at once, the other ones are
+        computed in the background and the totals updated as they come.
+        """
+        missing = []  # (path, True if it is copied)
+        sizes = self.sizes
+        for paths, copied in ((self.a_copier, True), (self.a_supp, False)):
+            total = 0
+            for path in paths:
+                size = sizes.get(path)
+                if size is None:
+                    missing.append((path, copied))
+                else:
+                    total += size[1]
+            if copied:
+                self._total_copy = total
+            else:
+                self._total_supp = total
+        self._display_size(bool(missing))
+        if missing:
+            Thread(target=self._tree_sizes, args=(missing,), name="size",
+                   daemon=True).start()
+            self._poll_id = self.after(100, self._poll_size)
+
+    def _tree_sizes(self, paths):
+        """Compute the size of paths (run in a separate thread)."""
+        for path, copied in paths:
+            if self._stop:
+                return
             try:
-                with scandir(path) as content:
-                    for f in content:
-                        try:
-                            if f.is_file():
-                                s += f.stat().st_size
-                            else:
-                                s += size(f.path)
-                        except FileNotFoundError:
-                            pass
-            except NotADirectoryError:
-                s = getsize(path)
-            return s
-
-        size_copy = 0
-        size_supp = 0
-
-        for path in self.a_copier:
-            size_copy += size(path)
-        for path in self.a_supp:
-            size_supp += size(path)
-        self._size_copy.configure(text=_("Copy: %(size)s") % {'size': convert_size(size_copy)})
-        self._size_supp.configure(text=_("Remove: %(size)s") % {'size': convert_size(size_supp)})
+                self._q_size.put((path, copied, tree_size(path)))
+            except OSError:
+                pass
+        self._q_size.put(None)
+
+    def _poll_size(self):
+        over = False
+        while not self._q_size.empty():
+            res = self._q_size.get()
+            if res is None:
+                over = True
+            else:
+                path, copied, size = res
+                self.sizes[path] = size
+                if copied:
+                    self._total_copy += size[1]
+                else:
+                    self._total_supp += size[1]
+        self._display_size(not over)
+        if over:
+            self._poll_id = None
+        else:
+            self._poll_id = self.after(200, self._poll_size)
+
+    def _display_size(self, computing=False):
+        size_copy = self._total_copy
+        size_supp = self._total_supp
+        if computing:
+            self._size_copy.configure(text=_("Copy: %(size)s (computing...)") % {'size': convert_size(size_copy)})
+            self._size_supp.configure(text=_("Remove: %(size)s (computing...)") % {'size': convert_size(size_supp)})
+        else:
+            self._size_copy.configure(text=_("Copy: %(size)s") % {'size': convert_size(size_copy)})
+            self._size_supp.configure(text=_("Remove: %(size)s") % {'size': convert_size(size_supp)})
+
+    def destroy(self):
+        self._stop = True
+        if self._poll_id is not None:
+            self.after_cancel(self._poll_id)
+            self._poll_id = None
+        Toplevel.destroy(self)
 
     def ok(self):
         """Close dialog and start sync."""
         self.grab_release()
-        self.master.copie_supp(self.a_copier, self.a_supp, self.a_supp_avant_cp)
+        self.master.copie_supp(self.a_copier, self.a_supp, self.a_supp_avant_cp,
+                               self.sizes)
         self.destroy()
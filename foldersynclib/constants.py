@@ -57,6 +57,21 @@ if not os.path.isdir(LOCAL_PATH):
 
 PID_FILE = os.path.join(LOCAL_PATH, "foldersync%i.pid")
 
+# folder containing the scan indexes of the synchronized pairs
+INDEX_PATH = os.path.join(LOCAL_PATH, "index")
+
+if not os.path.isdir(INDEX_PATH):
+    os.mkdir(INDEX_PATH)
+
+# checksum cache
+HASH_FILE = os.path.join(LOCAL_PATH, "hashes.db")
+
+# folder containing the journals of the ongoing synchronizations
+JOURNAL_PATH = os.path.join(LOCAL_PATH, "journal")
+
+if not os.path.isdir(JOURNAL_PATH):
+    os.mkdir(JOURNAL_PATH)
+
 # --- logs
 LOG_COPIE = os.path.join(LOCAL_PATH, "copie%i.log")
 LOG_SUPP = os.path.join(LOCAL_PATH, "suppression%i.log")
@@ -83,6 +98,24 @@ if not os.path.exists(PATH_CONFIG):
     CONFIG.add_section("Defaults")
     CONFIG.set("Defaults", "copy_links", "True")
     CONFIG.set("Defaults", "show_size", "True")
+    CONFIG.set("Defaults", "watch", "False")
+    CONFIG.set("Defaults", "compare", "mtime")
+    CONFIG.set("Defaults", "mtime_tolerance", "0")
+    CONFIG.set("Defaults", "scan_index", "True")
+    CONFIG.set("Defaults", "copy_workers", "4")
+    CONFIG.set("Defaults", "copy_workers_hdd", "1")
+    CONFIG.set("Defaults", "large_file_size", "64")
+    CONFIG.set("Defaults", "fsync", "none")
+    CONFIG.set("Defaults", "fsync_batch_files", "100")
+    CONFIG.set("Defaults", "fsync_batch_size", "64")
+    CONFIG.set("Defaults", "delta", "False")
+    CONFIG.set("Defaults", "delta_size", "256")
+    CONFIG.set("Defaults", "quarantine", "False")
+    CONFIG.set("Defaults", "quarantine_days", "30")
+    CONFIG.set("Defaults", "limit_rate", "0")
+    CONFIG.set("Defaults", "limit_files", "0")
+    CONFIG.set("Defaults", "adaptive", "False")
+    CONFIG.set("Defaults", "low_priority", "False")
     CONFIG.set("Defaults", "exclude_copie", "")
     CONFIG.set("Defaults", "exclude_supp", "")
     CONFIG.set("Defaults", "language", "")
@@ -97,6 +130,42 @@ else:
     CONFIG.read(PATH_CONFIG)
     if not CONFIG.has_option("Defaults", "show_size"):
         CONFIG.set("Defaults", "show_size", "True")
+    if not CONFIG.has_option("Defaults", "watch"):
+        CONFIG.set("Defaults", "watch", "False")
+    if not CONFIG.has_option("Defaults", "compare"):
+        CONFIG.set("Defaults", "compare", "mtime")
+    if not CONFIG.has_option("Defaults", "mtime_tolerance"):
+        CONFIG.set("Defaults", "mtime_tolerance", "0")
+    if not CONFIG.has_option("Defaults", "scan_index"):
+        CONFIG.set("Defaults", "scan_index", "True")
+    if not CONFIG.has_option("Defaults", "copy_workers"):
+        CONFIG.set("Defaults", "copy_workers", "4")
+    if not CONFIG.has_option("Defaults", "copy_workers_hdd"):
+        CONFIG.set("Defaults", "copy_workers_hdd", "1")
+    if not CONFIG.has_option("Defaults", "large_file_size"):
+        CONFIG.set("Defaults", "large_file_size", "64")
+    if not CONFIG.has_option("Defaults", "fsync"):
+        CONFIG.set("Defaults", "fsync", "none")
+    if not CONFIG.has_option("Defaults", "fsync_batch_files"):
+        CONFIG.set("Defaults", "fsync_batch_files", "100")
+    if not CONFIG.has_option("Defaults", "fsync_batch_size"):
+        CONFIG.set("Defaults", "fsync_batch_size", "64")
+    if not CONFIG.has_option("Defaults", "delta"):
+        CONFIG.set("Defaults", "delta", "False")
+    if not CONFIG.has_option("Defaults", "delta_size"):
+        CONFIG.set("Defaults", "delta_size", "256")
+    if not CONFIG.has_option("Defaults", "quarantine"):
+        CONFIG.set("Defaults", "quarantine", "False")
+    if not CONFIG.has_option("Defaults", "quarantine_days"):
+        CONFIG.set("Defaults", "quarantine_days", "30")
+    if not CONFIG.has_option("Defaults", "limit_rate"):
+        CONFIG.set("Defaults", "limit_rate", "0")
+    if not CONFIG.has_option("Defaults", "limit_files"):
+        CONFIG.set("Defaults", "limit_files", "0")
+    if not CONFIG.has_option("Defaults", "adaptive"):
+        CONFIG.set("Defaults", "adaptive", "False")
+    if not CONFIG.has_option("Defaults", "low_priority"):
+        CONFIG.set("Defaults", "low_priority", "False")
     if not CONFIG.has_option("Defaults", "language"):
         CONFIG.set("Defaults", "language", "")
     LANGUE = CONFIG.get("Defaults", "language")
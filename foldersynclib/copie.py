@@ -0,0 +1,897 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+FolderSync - Folder synchronization software
+Copyright 2017-2018 Juliette Monsel <j_4321@protonmail.com>
+
+FolderSync is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FolderSync is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Copy engine: in-process equivalent of 'cp -a --parents'
+"""
+
+import os
+import stat as st_
+from collections import deque
+from errno import EXDEV, ENOSYS, EINVAL, EOPNOTSUPP, ENOTSUP, EPERM, ENOTTY, \
+    ENXIO
+from fcntl import ioctl
+from os.path import join, dirname, basename, relpath, realpath
+from threading import Thread, Lock, Condition, BoundedSemaphore, Event
+from uuid import uuid4
+
+BUFFER_SIZE = 1024 * 1024
+# files larger than that are copied by dedicated workers
+LARGE_FILE = 64 * 1024 * 1024
+# size of the blocks compared by the delta transfer
+DELTA_BLOCK = 1024 * 1024
+
+# --- fsync policies
+FSYNC_NONE = "none"    # leave it to the system
+FSYNC_FILE = "file"    # fsync each file and its folder
+FSYNC_BATCH = "batch"  # fsync the files and their folders by batches
+FSYNC_POLICIES = (FSYNC_NONE, FSYNC_FILE, FSYNC_BATCH)
+
+# prefix of the temporary files, the copies are renamed once complete
+TMP_PREFIX = ".foldersync-"
+# errors meaning that the system call cannot be used for these files
+UNSUPPORTED = (EXDEV, ENOSYS, EINVAL, EOPNOTSUPP, ENOTSUP, EPERM)
+# ioctl cloning the content of a file into another one (reflink), on the
+# filesystems supporting copy-on-write (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+
+def _copy_range(fsrc, fdst, length, done):
+    """Copy with copy_file_range, return the number of bytes copied."""
+    copied = 0
+    while length is None or copied < length:
+        count = BUFFER_SIZE * 8
+        if length is not None:
+            count = min(count, length - copied)
+        n = os.copy_file_range(fsrc, fdst, count)
+        if n == 0:
+            break
+        copied += n
+        done(n)
+    return copied
+
+
+def _sendfile(fsrc, fdst, length, done):
+    """Copy with sendfile, return the number of bytes copied."""
+    copied = 0
+    while length is None or copied < length:
+        count = BUFFER_SIZE * 8
+        if length is not None:
+            count = min(count, length - copied)
+        n = os.sendfile(fdst, fsrc, None, count)
+        if n == 0:
+            break
+        copied += n
+        done(n)
+    return copied
+
+
+def _buffered(fsrc, fdst, length, done):
+    """Copy with read/write, return the number of bytes copied."""
+    buf = bytearray(BUFFER_SIZE)
+    view = memoryview(buf)
+    copied = 0
+    while length is None or copied < length:
+        count = BUFFER_SIZE
+        if length is not None:
+            count = min(count, length - copied)
+        n = os.readv(fsrc, [view[:count]])
+        if n == 0:
+            break
+        written = 0
+        while written < n:
+            written += os.write(fdst, view[written:n])
+        copied += n
+        done(n)
+    return copied
+
+
+def _nothing(n):
+    pass
+
+
+def _copy(fsrc, fdst, length, done):
+    """
+    Copy length bytes (everything if None) from the current positions of
+    fsrc and fdst, using the fastest method supported by the filesystems.
+    """
+    methods = [_buffered]
+    if hasattr(os, "sendfile"):
+        methods.insert(0, _sendfile)
+    if hasattr(os, "copy_file_range"):
+        methods.insert(0, _copy_range)
+    pos_src = os.lseek(fsrc, 0, os.SEEK_CUR)
+    pos_dst = os.lseek(fdst, 0, os.SEEK_CUR)
+    for method in methods[:-1]:
+        try:
+            return method(fsrc, fdst, length, done)
+        except OSError as e:
+            if e.errno not in UNSUPPORTED:
+                raise
+            # nothing can have been copied when these errors occur, but
+            # make sure that the fallback starts at the same place
+            os.lseek(fsrc, pos_src, os.SEEK_SET)
+            os.lseek(fdst, pos_dst, os.SEEK_SET)
+            os.ftruncate(fdst, pos_dst)
+    return methods[-1](fsrc, fdst, length, done)
+
+
+def _sparse(fsrc, fdst, size, done):
+    """
+    Copy only the data regions of fsrc, the holes are recreated by
+    truncating fdst to size. Return the number of bytes copied.
+    """
+    copied = 0
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fsrc, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno != ENXIO:
+                raise
+            # only a hole remains
+            break
+        end = os.lseek(fsrc, start, os.SEEK_HOLE)
+        done(start - offset)
+        os.lseek(fsrc, start, os.SEEK_SET)
+        os.lseek(fdst, start, os.SEEK_SET)
+        copied += _copy(fsrc, fdst, end - start, done)
+        offset = end
+    done(max(size - offset, 0))
+    os.ftruncate(fdst, size)
+    return copied
+
+
+def copy_data(fsrc, fdst, done=_nothing):
+    """
+    Copy the content of file descriptor fsrc into fdst (both positioned at
+    the start), using the fastest method supported by the filesystems and
+    preserving the holes of sparse files.
+
+    done is called with the number of bytes of each chunk handled (holes
+    included). Return the number of bytes actually copied.
+    """
+    st = os.fstat(fsrc)
+    if st.st_blocks * 512 < st.st_size and hasattr(os, "SEEK_DATA"):
+        try:
+            return _sparse(fsrc, fdst, st.st_size, done)
+        except OSError as e:
+            if e.errno not in UNSUPPORTED:
+                raise
+            # SEEK_DATA not supported by the filesystem: copy everything
+            os.lseek(fsrc, 0, os.SEEK_SET)
+            os.lseek(fdst, 0, os.SEEK_SET)
+            os.ftruncate(fdst, 0)
+    return _copy(fsrc, fdst, None, done)
+
+
+def delta_data(fsrc, fdst, done=_nothing):
+    """
+    Update fdst, an older copy of fsrc, in place: the two files are
+    compared block by block and only the blocks that differ are written,
+    then fdst is truncated to the size of fsrc.
+
+    done is called with the number of bytes of each block handled.
+    Return the number of bytes written.
+    """
+    size = os.fstat(fsrc).st_size
+    written = 0
+    offset = 0
+    while offset < size:
+        data = os.pread(fsrc, DELTA_BLOCK, offset)
+        if not data:
+            break
+        if os.pread(fdst, len(data), offset) != data:
+            n = 0
+            while n < len(data):
+                n += os.pwrite(fdst, data[n:], offset + n)
+            written += n
+        offset += len(data)
+        done(len(data))
+    os.ftruncate(fdst, offset)
+    return written
+
+
+def clone_data(fsrc, fdst):
+    """
+    Make fdst share the content of fsrc (reflink), return False if the
+    filesystems do not support it.
+    """
+    try:
+        ioctl(fdst, FICLONE, fsrc)
+    except OSError as e:
+        if e.errno not in UNSUPPORTED and e.errno != ENOTTY:
+            raise
+        return False
+    return True
+
+
+def copy_xattr(src, dst, follow_symlinks=True):
+    """Copy the extended attributes of src to dst (if supported)."""
+    try:
+        names = os.listxattr(src, follow_symlinks=follow_symlinks)
+    except (OSError, AttributeError):
+        return
+    for name in names:
+        try:
+            value = os.getxattr(src, name, follow_symlinks=follow_symlinks)
+            os.setxattr(dst, name, value, follow_symlinks=follow_symlinks)
+        except OSError:
+            # e.g. security.* attributes or unsupported by the destination
+            pass
+
+
+def copy_stat(st, dst):
+    """
+    Give dst the owner, mode and timestamps of st (stat result), like
+    'cp -a' which does not fail if the owner cannot be preserved.
+    """
+    link = st_.S_ISLNK(st.st_mode)
+    try:
+        os.chown(dst, st.st_uid, st.st_gid, follow_symlinks=False)
+    except PermissionError:
+        pass
+    if not link:
+        os.chmod(dst, st_.S_IMODE(st.st_mode))
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=False)
+
+
+def tmp_name(dst):
+    """Return a temporary name in the folder of dst."""
+    return join(dirname(dst), "%s%s-%s" % (TMP_PREFIX, uuid4().hex[:12],
+                                           basename(dst)[:200]))
+
+
+def fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Durability:
+    """
+    Put the complete copies (written in temporary files) in place.
+
+    The temporary file is renamed over the destination, so that a reader
+    or a crash never sees a half-written file, after having been fsync'ed
+    depending on the policy:
+
+        * FSYNC_NONE: the data is written back by the system
+        * FSYNC_FILE: each file and then its folder are fsync'ed
+        * FSYNC_BATCH: the renames are delayed until batch_files files or
+          batch_size bytes are pending, then the files are fsync'ed,
+          renamed and their folders fsync'ed at once
+
+    A function can be given with each copy, it is called once the copy is
+    in place (and fsync'ed), and not if this fails. It is the only way to
+    know that a copy is in place: with the batch policy, the renames are
+    done by whichever thread fills the batch.
+
+    It can be used from several threads.
+    """
+
+    def __init__(self, policy=FSYNC_NONE, batch_files=100,
+                 batch_size=64 * 1024 * 1024):
+        if policy not in FSYNC_POLICIES:
+            raise ValueError("Unknown fsync policy %r" % policy)
+        self.policy = policy
+        self.batch_files = batch_files
+        self.batch_size = batch_size
+        self._pending = []
+        self._pending_size = 0
+        self._lock = Lock()
+
+    def commit(self, fd, tmp, dst, size, done=None, now=False):
+        """
+        Put tmp (open as fd, closed by this method) in place of dst once
+        size bytes have been written in it, then call done().
+
+        now: put the copy in place before returning, even with the batch
+             policy (for the copies other ones depend on)
+        """
+        sync = self.policy == FSYNC_FILE or (now and
+                                             self.policy == FSYNC_BATCH)
+        try:
+            if sync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        if now or self.policy != FSYNC_BATCH:
+            os.replace(tmp, dst)
+            if sync:
+                fsync_dir(dirname(dst))
+            if done is not None:
+                done()
+            return
+        with self._lock:
+            self._pending.append((tmp, dst, done))
+            self._pending_size += size
+            if (len(self._pending) < self.batch_files and
+                    self._pending_size < self.batch_size):
+                return
+            pending = self._pending
+            self._pending = []
+            self._pending_size = 0
+        self._flush(pending)
+
+    def flush(self):
+        """Put the pending copies in place."""
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+            self._pending_size = 0
+        self._flush(pending)
+
+    @staticmethod
+    def _flush(pending):
+        errors = []
+        failed = set()  # copies that are not in place
+        for tmp, dst, done in pending:
+            try:
+                fd = os.open(tmp, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                errors.append(e)
+                failed.add(dst)
+        folders = set()
+        for tmp, dst, done in pending:
+            try:
+                os.replace(tmp, dst)
+            except OSError as e:
+                errors.append(e)
+                failed.add(dst)
+            folders.add(dirname(dst))
+        for folder in folders:
+            try:
+                fsync_dir(folder)
+            except OSError as e:
+                errors.append(e)
+                failed.update(dst for tmp, dst, done in pending
+                              if dirname(dst) == folder)
+        for tmp, dst, done in pending:
+            if done is not None and dst not in failed:
+                done()
+        if errors:
+            raise errors[0]
+
+
+class _Link:
+    """First copied link of a file with several links."""
+
+    __slots__ = ("dst", "done", "copied")
+
+    def __init__(self, dst):
+        self.dst = dst
+        self.done = Event()  # set once the copy is in place or failed
+        self.copied = False  # whether the copy is in place
+
+
+class Copier:
+    """
+    Copy entries of original to the same relative path in sauvegarde.
+
+    The missing parents are created with the attributes of the original
+    ones, folders are copied recursively, links are copied as links, hard
+    links within a copied tree are preserved as well as the owner, mode,
+    timestamps and extended attributes of the entries.
+
+    The errors are logged with logger and counted in nb_errors. The copied
+    files and bytes are counted with progress (Progress), if given.
+
+    When the filesystems support it, the files are cloned (reflink)
+    instead of copied. The bytes cloned and the ones actually copied are
+    counted in cloned and copied.
+
+    skip_existing: do not copy again the files whose backup has the same
+                   size and mtime (when resuming an interrupted copy, the
+                   mtime is only set once a file is completely copied)
+    durability: Durability putting the copied files in place, call
+                flush() once the copy is over
+    delta_size: if not 0, the existing backups of the files of at least
+                delta_size bytes are updated in place by rewriting only
+                the blocks that changed (the bytes saved are logged and
+                counted in saved). The mtime is set last, so a file whose
+                update was interrupted is seen as modified by the next
+                scan.
+    throttle: Throttle limiting the throughput of the copy
+    """
+
+    def __init__(self, original, sauvegarde, logger=None, progress=None,
+                 skip_existing=False, durability=None, delta_size=0,
+                 throttle=None):
+        self.original = original
+        self.sauvegarde = sauvegarde
+        self.logger = logger
+        self.progress = progress
+        self.skip_existing = skip_existing
+        self.durability = durability or Durability()
+        self.delta_size = delta_size
+        self.throttle = throttle
+        self.nb_errors = 0
+        self.cloned = 0
+        self.copied = 0
+        self.saved = 0
+        self._clone = {}  # (src dev, dst dev) -> whether cloning works
+        self._links = {}  # (dev, ino) -> _Link, for files with several links
+        self._lock = Lock()  # the methods can be called from several threads
+
+    def error(self, msg):
+        with self._lock:
+            self.nb_errors += 1
+        if self.logger is not None:
+            self.logger.error(msg)
+
+    def _done(self, n):
+        """Record that n bytes of a file were copied."""
+        if self.progress is not None:
+            self.progress.add(size=n)
+        if self.throttle is not None:
+            self.throttle.consume(size=n)
+
+    def _file_done(self, size=0):
+        """Record that an entry was copied (size: bytes not counted yet)."""
+        if self.progress is not None:
+            self.progress.add(1, size)
+        if self.throttle is not None:
+            self.throttle.consume(files=1)
+
+    def copy(self, path):
+        """Copy path (in original) to sauvegarde, return the number of bytes copied."""
+        rel = relpath(path, self.original)
+        dst = join(self.sauvegarde, rel)
+        try:
+            self.make_parents(dirname(rel))
+            return self.copy_entry(path, dst)
+        except OSError as e:
+            self.error(str(e))
+            return 0
+
+    def make_parents(self, rel):
+        """Create the missing parents of rel in sauvegarde."""
+        created = []
+        while rel and not os.path.isdir(join(self.sauvegarde, rel)):
+            created.append(rel)
+            rel = dirname(rel)
+        for rel in reversed(created):
+            src = join(self.original, rel)
+            dst = join(self.sauvegarde, rel)
+            os.mkdir(dst, 0o700)
+            st = os.stat(src)
+            copy_xattr(src, dst)
+            copy_stat(st, dst)
+
+    def copy_entry(self, src, dst, st=None, done=None):
+        """
+        Copy src to dst, return the number of bytes copied. done() is
+        called once dst is in place, which can be later with the batch
+        fsync policy, and not if the copy fails.
+        """
+        if st is None:
+            st = os.lstat(src)
+        mode = st.st_mode
+        if st_.S_ISDIR(mode):
+            size = self.copy_dir(src, dst, st)
+        elif st_.S_ISREG(mode):
+            if st.st_nlink > 1:
+                return self.copy_link(src, dst, st, done)
+            if self.skip_existing and self._is_copied(st, dst):
+                self._file_done(st.st_size)
+                size = 0
+            else:
+                size = self.copy_file(src, dst, st, done)
+                self._file_done()
+                return size
+        else:
+            size = self.copy_special(src, dst, st)
+        if done is not None:
+            done()
+        return size
+
+    def copy_special(self, src, dst, st):
+        """Copy link, fifo, device or socket src to dst."""
+        mode = st.st_mode
+        # the entry is created under a temporary name and renamed over dst,
+        # which replaces dst if it is a file or a link (even to a folder)
+        tmp = tmp_name(dst)
+        if st_.S_ISLNK(mode):
+            os.symlink(os.readlink(src), tmp)
+        elif st_.S_ISFIFO(mode):
+            os.mkfifo(tmp, 0o600)
+        else:
+            # device or socket
+            os.mknod(tmp, mode, st.st_rdev)
+        try:
+            copy_xattr(src, tmp, follow_symlinks=False)
+            copy_stat(st, tmp)
+            os.replace(tmp, dst)
+        except OSError:
+            os.unlink(tmp)
+            raise
+        self._file_done()
+        return 0
+
+    def copy_link(self, src, dst, st, done=None):
+        """
+        Copy src, regular file with several links, to dst. The first of
+        its links is copied, the next ones are hard links to this copy,
+        made once it is in place (it can be done by another worker).
+        """
+        key = (st.st_dev, st.st_ino)
+        with self._lock:
+            first = self._links.get(key)
+            if first is None:
+                first = self._links[key] = _Link(dst)
+        if first.dst != dst:
+            first.done.wait()
+            if first.copied:
+                tmp = tmp_name(dst)
+                os.link(first.dst, tmp)
+                os.replace(tmp, dst)
+                self._file_done(st.st_size)
+                if done is not None:
+                    done()
+                return 0
+            # the first copy failed: copy this one independently
+            return self._copy_first(src, dst, st, done)
+
+        def placed():
+            first.copied = True
+            first.done.set()
+            if done is not None:
+                done()
+
+        try:
+            return self._copy_first(src, dst, st, placed)
+        finally:
+            # release the next links if the copy failed
+            first.done.set()
+
+    def _copy_first(self, src, dst, st, done):
+        """Copy the first link of a file, which is in place when done() is called."""
+        if self.skip_existing and self._is_copied(st, dst):
+            self._file_done(st.st_size)
+            if done is not None:
+                done()
+            return 0
+        # the next links are made to this copy, it cannot wait for the
+        # batch of the durability policy
+        size = self.copy_file(src, dst, st, done, now=True)
+        self._file_done()
+        return size
+
+    @staticmethod
+    def _is_copied(st, dst):
+        """Return True if dst is a complete copy of the file of stat st."""
+        try:
+            st_d = os.lstat(dst)
+        except OSError:
+            return False
+        return (st_.S_ISREG(st_d.st_mode) and st_d.st_size == st.st_size and
+                st_d.st_mtime_ns == st.st_mtime_ns)
+
+    def copy_file(self, src, dst, st, done=None, now=False):
+        """
+        Copy regular file src to dst, return the number of bytes copied
+        and call done() once dst is in place (before returning if now is
+        True, see Durability.commit()).
+        """
+        if self.delta_size and st.st_size >= self.delta_size:
+            try:
+                st_d = os.lstat(dst)
+            except FileNotFoundError:
+                pass
+            else:
+                # the other links of the backup must not be modified
+                if st_.S_ISREG(st_d.st_mode) and st_d.st_nlink == 1:
+                    size = self.update_file(src, dst, st)
+                    if done is not None:
+                        done()
+                    return size
+        # the data is written in a temporary file renamed over dst once
+        # complete (this also replaces dst if it is a link instead of
+        # writing its target)
+        tmp = tmp_name(dst)
+        fsrc = os.open(src, os.O_RDONLY | os.O_NOFOLLOW)
+        try:
+            fdst = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            try:
+                size = self._copy_data(fsrc, fdst, st)
+                copy_xattr(src, tmp)
+                copy_stat(st, tmp)
+            except BaseException:
+                os.close(fdst)
+                os.unlink(tmp)
+                raise
+        finally:
+            os.close(fsrc)
+        self.durability.commit(fdst, tmp, dst, size, done, now)
+        return size
+
+    def update_file(self, src, dst, st):
+        """
+        Update dst, an older copy of regular file src, with the delta
+        transfer, return the size of src.
+        """
+        fsrc = os.open(src, os.O_RDONLY | os.O_NOFOLLOW)
+        try:
+            fdst = os.open(dst, os.O_RDWR | os.O_NOFOLLOW)
+            try:
+                written = delta_data(fsrc, fdst, self._done)
+                if self.durability.policy != FSYNC_NONE:
+                    os.fsync(fdst)
+            finally:
+                os.close(fdst)
+        finally:
+            os.close(fsrc)
+        copy_xattr(src, dst)
+        copy_stat(st, dst)
+        saved = st.st_size - written
+        with self._lock:
+            self.copied += written
+            self.saved += saved
+        if self.logger is not None:
+            self.logger.info("%s: %i bytes written, %i bytes saved"
+                             % (dst, written, saved))
+        return st.st_size
+
+    def _copy_data(self, fsrc, fdst, st):
+        """Clone or copy the content of the file, return its size."""
+        devs = (st.st_dev, os.fstat(fdst).st_dev)
+        if self._clone.get(devs, True):
+            if clone_data(fsrc, fdst):
+                with self._lock:
+                    self.cloned += st.st_size
+                if self.progress is not None:
+                    self.progress.add(size=st.st_size)
+                return st.st_size
+            # do not try again between these filesystems
+            self._clone[devs] = False
+        copied = copy_data(fsrc, fdst, self._done)
+        with self._lock:
+            self.copied += copied
+        return st.st_size
+
+    def copy_dir(self, src, dst, st):
+        """Copy folder src and its content to dst, return the number of bytes copied."""
+        try:
+            os.mkdir(dst, 0o700)
+        except FileExistsError:
+            if not os.path.isdir(dst):
+                raise
+        size = 0
+        with os.scandir(src) as content:
+            items = list(content)
+        for item in items:
+            try:
+                size += self.copy_entry(item.path, join(dst, item.name),
+                                        item.stat(follow_symlinks=False))
+            except OSError as e:
+                self.error(str(e))
+        # the attributes of the folder are set last so that the mtime is
+        # not changed by the copy of its content
+        self.durability.flush()
+        copy_xattr(src, dst)
+        copy_stat(st, dst)
+        return size
+
+
+def is_rotational(dev):
+    """Return True if device dev (st_dev) is a spinning disk."""
+    path = realpath("/sys/dev/block/%i:%i" % (os.major(dev), os.minor(dev)))
+    # partitions do not have a queue, it is the one of their disk
+    for queue in (join(path, "queue"), join(dirname(path), "queue")):
+        try:
+            with open(join(queue, "rotational")) as f:
+                return f.read().strip() == "1"
+        except OSError:
+            pass
+    return False
+
+
+class CopyPool:
+    """
+    Copy entries with a pool of worker threads.
+
+    The folders are walked (and created in the backup) by the calling
+    thread while the workers copy the files: the small files are spread
+    across the workers and the files larger than large_file are streamed
+    by a dedicated one (which also handles small files when it has no
+    large file to copy). Each device accepts at most workers simultaneous
+    copies, or hdd_workers if it is a spinning disk, so that its head does
+    not keep jumping between files.
+
+    copier: Copier used for the copy
+    entry_done: function called from the workers with the index (in the
+                list given to run()) of each entry whose copy is over and
+                in place (not called if some of its content failed)
+    """
+
+    def __init__(self, copier, workers=4, hdd_workers=1,
+                 large_file=LARGE_FILE, entry_done=None):
+        self.copier = copier
+        self.workers = max(1, workers)
+        self.hdd_workers = max(1, hdd_workers)
+        self.large_file = large_file
+        self.entry_done = entry_done
+        self._cond = Condition()
+        self._small = deque()
+        self._large = deque()
+        self._closed = False
+        self._remaining = {}  # entry index -> number of pending tasks
+        self._failed = set()  # entries of which a task failed
+        self._devices = {}    # st_dev -> semaphore
+        self.size = 0         # number of bytes copied
+
+    def _semaphore(self, dev):
+        sem = self._devices.get(dev)
+        if sem is None:
+            limit = self.hdd_workers if is_rotational(dev) else self.workers
+            sem = self._devices.setdefault(dev, BoundedSemaphore(limit))
+        return sem
+
+    def _put(self, i, src, dst, st):
+        with self._cond:
+            self._remaining[i] += 1
+            if st_.S_ISREG(st.st_mode) and st.st_size > self.large_file:
+                self._large.append((i, src, dst, st))
+            else:
+                self._small.append((i, src, dst, st))
+            self._cond.notify()
+
+    def _task_done(self, i, ok=True):
+        with self._cond:
+            if not ok:
+                self._failed.add(i)
+            self._remaining[i] -= 1
+            if self._remaining[i]:
+                return
+            del self._remaining[i]
+            if i in self._failed:
+                return
+        if self.entry_done is not None:
+            self.entry_done(i)
+
+    def _get(self, large):
+        """Return the next task of the worker, None when there is none left."""
+        with self._cond:
+            while True:
+                if large and self._large:
+                    return self._large.popleft()
+                if self._small:
+                    return self._small.popleft()
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+    def _worker(self, large, dev_s):
+        copier = self.copier
+        if copier.throttle is not None:
+            copier.throttle.started()
+        sem_s = self._semaphore(dev_s)
+        while True:
+            task = self._get(large)
+            if task is None:
+                return
+            i, src, dst, st = task
+            sems = [self._semaphore(st.st_dev)]
+            if st.st_dev != dev_s:
+                sems.append(sem_s)
+            # always acquire in the same order to avoid deadlocks
+            sems.sort(key=id)
+            for sem in sems:
+                sem.acquire()
+            # the task is over once the copy is in place
+            in_place = []
+
+            def done(i=i):
+                in_place.append(True)
+                self._task_done(i)
+
+            try:
+                size = copier.copy_entry(src, dst, st, done)
+                with self._cond:
+                    self.size += size
+            except OSError as e:
+                copier.error(str(e))
+                # the error can come from the flush of the batch of other
+                # copies, once this one is in place
+                if not in_place:
+                    self._task_done(i, False)
+            finally:
+                for sem in sems:
+                    sem.release()
+
+    def _plan_dir(self, i, src, dst, st, folders):
+        """Create folder dst and queue the copy of the content of src."""
+        try:
+            os.mkdir(dst, 0o700)
+        except FileExistsError:
+            if not os.path.isdir(dst):
+                raise
+        folders.append((src, dst, st))
+        with os.scandir(src) as content:
+            items = list(content)
+        for item in items:
+            try:
+                st_item = item.stat(follow_symlinks=False)
+                path = join(dst, item.name)
+                if st_.S_ISDIR(st_item.st_mode):
+                    self._plan_dir(i, item.path, path, st_item, folders)
+                else:
+                    self._put(i, item.path, path, st_item)
+            except OSError as e:
+                self.copier.error(str(e))
+                with self._cond:
+                    self._failed.add(i)
+
+    def run(self, paths, log=None):
+        """
+        Copy paths (in the original of the copier) and return the number of
+        bytes copied. log is called with each path before it is handled.
+        """
+        copier = self.copier
+        dev_s = os.stat(copier.sauvegarde).st_dev
+        threads = [Thread(target=self._worker, name="copie%i" % k,
+                          daemon=True, args=(k == 0, dev_s))
+                   for k in range(self.workers)]
+        for t in threads:
+            t.start()
+        folders = []
+        for i, path in enumerate(paths):
+            if log is not None:
+                log(path)
+            with self._cond:
+                # the entry is not over until its walk is
+                self._remaining[i] = 1
+            rel = relpath(path, copier.original)
+            dst = join(copier.sauvegarde, rel)
+            ok = True
+            try:
+                copier.make_parents(dirname(rel))
+                st = os.lstat(path)
+                if st_.S_ISDIR(st.st_mode):
+                    self._plan_dir(i, path, dst, st, folders)
+                else:
+                    self._put(i, path, dst, st)
+            except OSError as e:
+                copier.error(str(e))
+                ok = False
+            self._task_done(i, ok)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for t in threads:
+            t.join()
+        try:
+            copier.durability.flush()
+        except OSError as e:
+            copier.error(str(e))
+        # the attributes of the folders are set once their content is
+        # copied, children first so that the mtimes are kept
+        for src, dst, st in reversed(folders):
+            try:
+                copy_xattr(src, dst)
+                copy_stat(st, dst)
+            except OSError as e:
+                copier.error(str(e))
+        return self.size
@@ -0,0 +1,228 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+FolderSync - Folder synchronization software
+Copyright 2017-2018 Juliette Monsel <j_4321@protonmail.com>
+
+FolderSync is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FolderSync is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Diff model (result of the comparison of the original and the backup)
+"""
+
+from array import array
+from os.path import join
+
+# --- entry kinds
+FILE = "file"
+DIR = "dir"
+LINK = "link"
+
+# --- entry states
+PARTIAL = "partial"      # folder containing some entries to copy / delete
+WHOLE = "whole"          # new entry, copied / deleted entirely
+MODIFIED = "modified"    # file modified since the last backup
+CONFLICT = "conflict"    # not of the same kind on the original and the backup
+
+# kinds and states are packed in one byte per entry: kind | state << 2
+KINDS = (FILE, DIR, LINK)
+STATES = (PARTIAL, WHOLE, MODIFIED, CONFLICT)
+_KIND_CODES = {kind: i for i, kind in enumerate(KINDS)}
+_STATE_CODES = {state: i << 2 for i, state in enumerate(STATES)}
+_CONFLICT_CODE = _STATE_CODES[CONFLICT]
+
+
+def _flag_tags(flag):
+    """Return the treeview tags of an entry with the given flag."""
+    if STATES[flag >> 2] == PARTIAL:
+        return ()
+    tags = ("whole",)
+    if STATES[flag >> 2] == CONFLICT:
+        tags += ("warning",)
+    if KINDS[flag & 3] == LINK:
+        tags += ("link",)
+    return tags
+
+
+_TAGS = {k | s: _flag_tags(k | s) for k in _KIND_CODES.values()
+         for s in _STATE_CODES.values()}
+
+
+class DiffTree:
+    """
+    Entries to copy (or to delete) below root, in depth-first order so that
+    each parent comes before its children.
+
+    Folders are entered with enter() and left with leave(). They are only
+    added to the tree once one of their descendants is, so empty branches
+    never appear.
+
+    The entries are identified by their index, the root being 0. To keep
+    multi-million entry trees small, they are stored column-wise: name
+    (interned, so that the names repeated across folders are stored once),
+    index of the parent, depth, kind and state packed in a flag byte and
+    size (-1 if unknown). Full paths are only built by path().
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.names = [root]
+        self.parents = array("i", [-1])
+        self.depths = array("H", [0])
+        self.flags = bytearray([_KIND_CODES[DIR]])
+        self.sizes = array("q", [-1])
+        self._interned = {}
+        self._totals = None
+        # folders that have been entered, as [index, name, flag, size], the
+        # index being None until the folder is added to the tree
+        self._stack = [[0, root, 0, -1]]
+
+    def __len__(self):
+        """Number of entries, root excluded."""
+        return len(self.names) - 1
+
+    def __bool__(self):
+        return len(self.names) > 1
+
+    def _append(self, name, parent, flag, size):
+        name = self._interned.setdefault(name, name)
+        self.names.append(name)
+        self.parents.append(parent)
+        self.depths.append(self.depths[parent] + 1)
+        self.flags.append(flag)
+        self.sizes.append(size)
+        return len(self.names) - 1
+
+    def _flush(self):
+        """Add the folders entered so far to the tree."""
+        parent = 0
+        for elt in self._stack:
+            if elt[0] is None:
+                elt[0] = self._append(elt[1], parent, elt[2], elt[3])
+            parent = elt[0]
+        return parent
+
+    def enter(self, name, kind=DIR, state=PARTIAL, size=-1):
+        """Enter folder name of the current folder."""
+        self._stack.append([None, name,
+                            _KIND_CODES[kind] | _STATE_CODES[state], size])
+        if state != PARTIAL:
+            self._flush()
+
+    def leave(self):
+        """Go back to the parent folder."""
+        self._stack.pop()
+
+    def add(self, name, kind, state, size=-1):
+        """Add entry name of the current folder and return its index."""
+        parent = self._flush()
+        return self._append(name, parent,
+                            _KIND_CODES[kind] | _STATE_CODES[state], size)
+
+    # --- entries
+    def path(self, i):
+        """Return the full path of entry i."""
+        names = self.names
+        parents = self.parents
+        parts = []
+        while i > 0:
+            parts.append(names[i])
+            i = parents[i]
+        parts.append(self.root)
+        return join(*reversed(parts))
+
+    def children(self, i):
+        """
+        Return the indexes of the children of entry i (found by walking
+        its subtree, in time proportional to its size).
+        """
+        depths = self.depths
+        depth = depths[i] + 1
+        children = []
+        for j in range(i + 1, len(self.names)):
+            if depths[j] < depth:
+                break
+            elif depths[j] == depth:
+                children.append(j)
+        return children
+
+    def kind(self, i):
+        return KINDS[self.flags[i] & 3]
+
+    def state(self, i):
+        return STATES[self.flags[i] >> 2]
+
+    def tags(self, i):
+        """Return the treeview tags corresponding to entry i."""
+        return _TAGS[self.flags[i]]
+
+    def totals(self):
+        """
+        Compute, for all the entries, the number of files (folders
+        excluded) and the size of the files of their subtree, in one pass
+        over the tree. The size is -1 if the one of a file is unknown.
+
+        The result is cached: call it once the tree is complete.
+        """
+        if self._totals is not None:
+            return self._totals
+        n = len(self.names)
+        files = array("q", bytes(8 * n))
+        sizes = array("q", bytes(8 * n))
+        flags = self.flags
+        parents = self.parents
+        own_sizes = self.sizes
+        file_code = _KIND_CODES[FILE]
+        dir_code = _KIND_CODES[DIR]
+        # the children come after their parent
+        for i in range(n - 1, 0, -1):
+            kind = flags[i] & 3
+            if kind != dir_code:
+                files[i] += 1
+                if kind == file_code:
+                    sizes[i] = own_sizes[i]
+            p = parents[i]
+            files[p] += files[i]
+            if sizes[i] < 0 or sizes[p] < 0:
+                sizes[p] = -1
+            else:
+                sizes[p] += sizes[i]
+        self._totals = files, sizes
+        return self._totals
+
+    def total(self, i):
+        """
+        Return (number of files, size) of entry i and its content, None if
+        unknown.
+        """
+        files, sizes = self.totals()
+        if sizes[i] < 0:
+            return None
+        return files[i], sizes[i]
+
+    def conflicts(self):
+        """Return the list of paths that are not of the same kind on both sides."""
+        return [self.path(i) for i, flag in enumerate(self.flags)
+                if flag & 12 == _CONFLICT_CODE]
+
+
+class Diff:
+    """Result of the comparison of original and sauvegarde."""
+
+    def __init__(self, original, sauvegarde):
+        self.original = original
+        self.sauvegarde = sauvegarde
+        self.copie = DiffTree(original)
+        self.supp = DiffTree(sauvegarde)
+        self.errors = []
+        self.cancelled = False
@@ -30,8 +30,9 @@ from re import split
 
 class ExclusionsCopie(Toplevel):
     """
-    List of file/folder names and file extensions (e.g. *.pyc) that will be
-    excluded from the copy.
+    List of patterns (file/folder names, globs like *.pyc, anchored paths
+    like /build/, re: regexps) of the entries that will be excluded from the
+    copy. See foldersynclib.matcher for the syntax.
     """
     def __init__(self, master):
         Toplevel.__init__(self, master)
@@ -104,7 +105,7 @@ class ExclusionsCopie(Toplevel):
         if sel:
             sel = sel[0]
             txt = self.listbox.get(sel)
-            self.exclude_list.remove(txt)
+            self.exclude_list.remove(txt.replace(" ", "\ "))
             self.listbox.delete(sel)
 
     def quitter(self):
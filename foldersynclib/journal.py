@@ -0,0 +1,173 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+FolderSync - Folder synchronization software
+Copyright 2017-2018 Juliette Monsel <j_4321@protonmail.com>
+
+FolderSync is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FolderSync is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Sync journal: operations planned by a synchronization and the ones already
+done, so that an interrupted synchronization can be resumed.
+"""
+
+import json
+import os
+from fcntl import flock, LOCK_EX, LOCK_NB
+from hashlib import sha1
+from os.path import join
+from threading import Lock
+
+# kinds of operations
+SUPP_AVANT_CP = "r"  # removal before copy
+COPIE = "c"
+SUPP = "s"
+
+
+def journal_file(folder, original, sauvegarde):
+    """Return the path of the journal of the pair in folder."""
+    key = sha1(("%s\0%s" % (original, sauvegarde)).encode()).hexdigest()
+    return join(folder, "%s.journal" % key[:16])
+
+
+def stamp(path):
+    """Return the (mtime_ns, size) of path, None if it does not exist."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class Journal:
+    """
+    Journal of a synchronization, stored in filename.
+
+    The first line contains the planned operations and the stamps of the
+    entries to copy, each following line records an operation done as
+    '<kind> <index>'. The file is locked while it is used so that another
+    instance of the application does not resume the same synchronization.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.original = ""
+        self.sauvegarde = ""
+        self.operations = {SUPP_AVANT_CP: [], COPIE: [], SUPP: []}
+        self.stamps = []
+        self.done = {SUPP_AVANT_CP: set(), COPIE: set(), SUPP: set()}
+        self._file = None
+        self._lock = Lock()
+
+    # --- writing
+    def start(self, original, sauvegarde, a_copier, a_supp, a_supp_avant_cp):
+        """Record the operations of a new synchronization."""
+        self.original = original
+        self.sauvegarde = sauvegarde
+        self.operations = {SUPP_AVANT_CP: a_supp_avant_cp, COPIE: a_copier,
+                           SUPP: a_supp}
+        self.stamps = [stamp(path) for path in a_copier]
+        header = {"original": original, "sauvegarde": sauvegarde,
+                  "operations": self.operations, "stamps": self.stamps}
+        # the journal is replaced atomically so that a crash cannot leave a
+        # truncated header
+        tmp = self.filename + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps(header) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filename)
+        self._open()
+
+    def _open(self):
+        self._file = open(self.filename, "a", buffering=1)
+        flock(self._file, LOCK_EX | LOCK_NB)
+
+    def mark_done(self, kind, i):
+        """Record that operation i of kind is done (from any thread)."""
+        with self._lock:
+            if self._file is not None:
+                self._file.write("%s %i\n" % (kind, i))
+
+    def close(self, remove=False):
+        """Close the journal, and delete it if remove is True."""
+        if self._file is not None:
+            if remove:
+                os.remove(self.filename)
+            self._file.close()
+            self._file = None
+        elif remove and os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    # --- reading
+    @classmethod
+    def load(cls, filename):
+        """
+        Return the journal stored in filename, locked, or None if it is in
+        use or unreadable.
+        """
+        journal = cls(filename)
+        try:
+            journal._open()
+        except OSError:
+            # locked by another instance
+            if journal._file is not None:
+                journal._file.close()
+            return None
+        with open(filename) as f:
+            try:
+                header = json.loads(f.readline())
+                journal.original = header["original"]
+                journal.sauvegarde = header["sauvegarde"]
+                journal.operations = header["operations"]
+                journal.stamps = [s if s is None else tuple(s)
+                                  for s in header["stamps"]]
+            except (ValueError, KeyError, TypeError):
+                journal.close(True)
+                return None
+            for line in f:
+                # the last line may have been cut by a crash
+                if not line.endswith("\n"):
+                    break
+                kind, i = line.split()
+                journal.done[kind].add(int(i))
+        return journal
+
+    def remaining(self, kind):
+        """Return the list of the operations of kind that are not done."""
+        done = self.done[kind]
+        return [path for i, path in enumerate(self.operations[kind])
+                if i not in done]
+
+    def unchanged(self):
+        """
+        Return True if the entries remaining to copy did not change since
+        the start of the synchronization (cheap check: only their own
+        mtime and size are compared).
+        """
+        done = self.done[COPIE]
+        for i, (path, st) in enumerate(zip(self.operations[COPIE], self.stamps)):
+            if i not in done and stamp(path) != st:
+                return False
+        return True
+
+
+def pending_journals(folder):
+    """Return the journals of folder that can be resumed."""
+    journals = []
+    for name in sorted(os.listdir(folder)):
+        if name.endswith(".journal"):
+            journal = Journal.load(join(folder, name))
+            if journal is not None:
+                journals.append(journal)
+    return journals
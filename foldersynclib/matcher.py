@@ -0,0 +1,182 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+FolderSync - Folder synchronization software
+Copyright 2017-2018 Juliette Monsel <j_4321@protonmail.com>
+
+FolderSync is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FolderSync is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Exclusion patterns
+
+The patterns follow the gitignore syntax:
+
+    * name: file / folder called name, anywhere in the tree
+    * *.ext, a?c*, [ab]*: glob matched against the name of the entries
+    * /path/to/entry, path/*.ext: pattern anchored at the root of the tree
+      (as soon as it contains a slash), '**' matches any number of folders
+    * pattern/: only matches folders
+    * re:regexp: regular expression searched in the path of the entry
+      relative to the root of the tree
+"""
+
+import re
+from os.path import join
+
+
+def parse_patterns(value):
+    """Return the list of patterns stored in the configuration value."""
+    return [p.replace("\\ ", " ") for p in re.split(r'(?<!\\) ', value) if p]
+
+
+def glob_to_regexp(pattern):
+    """
+    Translate glob pattern into a regular expression: '*' and '?' do not
+    match '/' while '**' matches anything.
+    """
+    res = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            if pattern[i:i + 1] == "*":
+                i += 1
+                if pattern[i:i + 1] == "/":
+                    # '**/': any number of folders
+                    i += 1
+                    res.append("(?:.*/)?")
+                else:
+                    res.append(".*")
+            else:
+                res.append("[^/]*")
+        elif c == "?":
+            res.append("[^/]")
+        elif c == "[":
+            j = pattern.find("]", i + 1 if pattern[i:i + 1] in ("!", "]") else i)
+            if j < 0:
+                res.append("\\[")
+            else:
+                content = pattern[i:j]
+                i = j + 1
+                if content.startswith("!"):
+                    content = "^" + content[1:]
+                res.append("[%s]" % content.replace("\\", "\\\\"))
+        else:
+            res.append(re.escape(c))
+    return "".join(res)
+
+
+class _Rules:
+    """Compiled set of rules."""
+
+    def __init__(self):
+        self.names = set()
+        self.exts = set()
+        self.paths = set()
+        self._name_globs = []
+        self._path_globs = []
+        self.name_re = None
+        self.path_re = None
+
+    def add(self, pattern):
+        if pattern.startswith("re:"):
+            self._path_globs.append("(?:%s)" % pattern[3:])
+            return
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        wildcard = any(c in pattern for c in "*?[")
+        if not anchored:
+            if not wildcard:
+                self.names.add(pattern)
+            elif (pattern.startswith("*.") and "." not in pattern[2:] and
+                    not any(c in pattern[1:] for c in "*?[")):
+                self.exts.add(pattern[1:])
+            else:
+                self._name_globs.append(glob_to_regexp(pattern))
+        elif not wildcard:
+            self.paths.add(pattern)
+        else:
+            self._path_globs.append("^%s$" % glob_to_regexp(pattern))
+
+    def compile(self):
+        if self._name_globs:
+            self.name_re = re.compile("(?:%s)$" % "|".join(self._name_globs))
+        if self._path_globs:
+            self.path_re = re.compile("|".join(self._path_globs))
+
+    def __bool__(self):
+        return bool(self.names or self.exts or self.paths or
+                    self._name_globs or self._path_globs)
+
+    def match(self, parent, name):
+        if name in self.names:
+            return True
+        if self.exts:
+            i = name.rfind(".")
+            if i >= 0 and name[i:] in self.exts:
+                return True
+        if self.name_re is not None and self.name_re.match(name):
+            return True
+        if self.paths or self.path_re is not None:
+            rel = join(parent, name)
+            if rel in self.paths:
+                return True
+            if self.path_re is not None and self.path_re.search(rel):
+                return True
+        return False
+
+
+class ExclusionMatcher:
+    """
+    Exclusion patterns compiled once: matching an entry costs a couple of
+    hash lookups and at most two regular expression matches, whatever the
+    number of patterns.
+
+    patterns: list of patterns (see the module docstring)
+    root: if given, the absolute paths inside root are anchored patterns
+          relative to root and the other absolute paths are ignored
+    """
+
+    def __init__(self, patterns=(), root=None):
+        self._any = _Rules()
+        self._dir = _Rules()   # rules that only match folders
+        prefix = join(root, "") if root else None
+        for pattern in patterns:
+            if prefix is not None and pattern.startswith("/"):
+                if not (pattern + "/").startswith(prefix):
+                    continue
+                pattern = "/" + pattern[len(prefix):]
+                if pattern == "/":
+                    continue
+            if pattern.endswith("/") and not pattern.startswith("re:"):
+                pattern = pattern.rstrip("/")
+                if pattern:
+                    self._dir.add(pattern)
+            else:
+                self._any.add(pattern)
+        self._any.compile()
+        self._dir.compile()
+        self._has_dir = bool(self._dir)
+
+    def __bool__(self):
+        return bool(self._any) or self._has_dir
+
+    def match(self, parent, name, is_dir=False):
+        """
+        Return True if entry name, in folder parent (path relative to the
+        root of the tree), is excluded.
+        """
+        return (self._any.match(parent, name) or
+                (is_dir and self._has_dir and self._dir.match(parent, name)))
@@ -0,0 +1,131 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+FolderSync - Folder synchronization software
+Copyright 2017-2018 Juliette Monsel <j_4321@protonmail.com>
+
+FolderSync is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FolderSync is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Progress of the copy and removal: counters in files and bytes, throughput
+and ETA
+"""
+
+from collections import deque
+from os import scandir, lstat
+from stat import S_ISDIR, S_ISREG
+from threading import Lock
+from time import monotonic
+
+
+def tree_size(path):
+    """
+    Return the number of files (folders excluded) and the size in bytes
+    of the regular files of path and its content.
+    """
+    st = lstat(path)
+    if not S_ISDIR(st.st_mode):
+        return 1, st.st_size if S_ISREG(st.st_mode) else 0
+    nb, size = 0, 0
+    stack = [path]
+    while stack:
+        try:
+            with scandir(stack.pop()) as content:
+                for item in content:
+                    try:
+                        if item.is_dir(follow_symlinks=False):
+                            stack.append(item.path)
+                        else:
+                            nb += 1
+                            if item.is_file(follow_symlinks=False):
+                                size += item.stat(follow_symlinks=False).st_size
+                    except FileNotFoundError:
+                        pass
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+    return nb, size
+
+
+class Progress:
+    """
+    Number of files and bytes handled so far, updated from the working
+    threads. ("done", files, bytes) is put in queue at most every interval
+    seconds and when flush() is called.
+    """
+
+    def __init__(self, queue, interval=0.1):
+        self.queue = queue
+        self.interval = interval
+        self.files = 0
+        self.size = 0
+        self.start = monotonic()
+        self._next = 0
+        self._lock = Lock()
+
+    def set_total(self, files, size):
+        """Send the total number of files and bytes to handle."""
+        self.queue.put(("total", files, size))
+
+    def add(self, files=0, size=0):
+        with self._lock:
+            self.files += files
+            self.size += size
+            now = monotonic()
+            if now >= self._next:
+                self._next = now + self.interval
+                self.queue.put(("done", self.files, self.size))
+
+    def flush(self):
+        with self._lock:
+            self.queue.put(("done", self.files, self.size))
+
+    def summary(self):
+        """Return (files, bytes, duration in s, average throughput in B/s)."""
+        duration = monotonic() - self.start
+        return self.files, self.size, duration, self.size / max(duration, 1e-6)
+
+
+class Throughput:
+    """Throughput measured over the last window seconds, and ETA."""
+
+    def __init__(self, window=5):
+        self.window = window
+        self._points = deque()
+
+    def update(self, size):
+        """Record that size bytes are done and return the throughput in B/s."""
+        now = monotonic()
+        points = self._points
+        points.append((now, size))
+        while len(points) > 2 and now - points[0][0] > self.window:
+            points.popleft()
+        t0, s0 = points[0]
+        if now - t0 < 1e-3:
+            return 0
+        return (size - s0) / (now - t0)
+
+    @staticmethod
+    def eta(remaining, rate):
+        """Return the estimated time left (in s), None if unknown."""
+        if rate <= 0:
+            return None
+        return remaining / rate
+
+
+def format_duration(seconds):
+    """Return seconds as [h:]mm:ss."""
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    if h:
+        return "%i:%02i:%02i" % (h, m, s)
+    return "%i:%02i" % (m, s)
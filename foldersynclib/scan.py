@@ -0,0 +1,398 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+FolderSync - Folder synchronization software
+Copyright 2017-2018 Juliette Monsel <j_4321@protonmail.com>
+
+FolderSync is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FolderSync is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Scan engine: comparison of the original and the backup, independent from
+the GUI.
+"""
+
+from os import scandir, stat, lstat
+from os.path import exists, join
+from foldersynclib.diff import Diff, FILE, DIR, LINK, WHOLE, MODIFIED, CONFLICT
+from foldersynclib.scanindex import ScanIndex, IndexEntry, CachedStat, \
+    ORIGINAL, SAUVEGARDE, entry_kind
+from foldersynclib.compare import Comparator
+from foldersynclib.matcher import ExclusionMatcher
+
+
+def get_name(elt):
+    return elt.name.lower(), elt.name
+
+
+def merge(lo, ls):
+    """
+    Merge the listings lo and ls (lists of DirEntry sorted with get_name).
+
+    Yield (item_o, item_s) pairs where item_o (resp. item_s) is None if the
+    entry only exists in ls (resp. lo), in linear time.
+    """
+    io = iter(lo)
+    i_s = iter(ls)
+    item_o = next(io, None)
+    item_s = next(i_s, None)
+    if item_o is not None:
+        key_o = get_name(item_o)
+    if item_s is not None:
+        key_s = get_name(item_s)
+    while item_o is not None and item_s is not None:
+        if key_o == key_s:
+            yield item_o, item_s
+            item_o = next(io, None)
+            item_s = next(i_s, None)
+            if item_o is not None:
+                key_o = get_name(item_o)
+            if item_s is not None:
+                key_s = get_name(item_s)
+        elif key_o < key_s:
+            yield item_o, None
+            item_o = next(io, None)
+            if item_o is not None:
+                key_o = get_name(item_o)
+        else:
+            yield None, item_s
+            item_s = next(i_s, None)
+            if item_s is not None:
+                key_s = get_name(item_s)
+    if item_o is not None:
+        yield item_o, None
+        for item_o in io:
+            yield item_o, None
+    if item_s is not None:
+        yield None, item_s
+        for item_s in i_s:
+            yield None, item_s
+
+
+class Scanner:
+    """
+    Compare an original folder with its backup.
+
+    copy_links: whether symbolic links are copied
+    exclude_copie: ExclusionMatcher of the entries excluded from the copy
+    exclude_supp: ExclusionMatcher of the entries excluded from the removal
+                  (relative to the backup)
+    comparator: Comparator deciding whether a file present on both sides
+                has to be copied (default: modification time)
+    index_file: path of the ScanIndex of the pair (optional), the folders
+                that did not change since the last scan are not listed again
+                and the metadata of the unchanged backup files is reused
+    clean: function telling whether a folder of the original (given by its
+           path relative to original) is known not to have changed since
+           the last scan (watch mode), in which case the metadata of its
+           files stored in the index is reused
+    progress: function called with the Diff being built and the number of
+              entries scanned so far, every batch_size entries and once at
+              the end of the scan
+    sizes: whether the size of the new files is recorded in the Diff (one
+           more stat per file), so that the totals of the selection are
+           known without walking it again
+    trust_backup: whether the metadata of the backup files stored in the
+                  index is reused, if False they are stat'ed (a file
+                  rewritten in place does not change the mtime of its
+                  folder)
+    """
+
+    def __init__(self, copy_links=True, exclude_copie=None, exclude_supp=None,
+                 comparator=None, index_file=None, clean=None, progress=None,
+                 batch_size=1000, sizes=False, trust_backup=True):
+        self.copy_links = copy_links
+        self.sizes = sizes
+        self.trust_backup = trust_backup
+        self.exclude_copie = exclude_copie or ExclusionMatcher()
+        self.exclude_supp = exclude_supp or ExclusionMatcher()
+        self.comparator = comparator or Comparator()
+        self.index_file = index_file
+        self.clean = clean
+        self._index = None
+        self.progress = progress
+        self.batch_size = batch_size
+        self.nb_scanned = 0
+        self._cancelled = False
+
+    def cancel(self):
+        """Stop the scan (it can be called from another thread)."""
+        self._cancelled = True
+
+    def _tick(self, n):
+        """Count n more scanned entries and report the progress if needed."""
+        self.nb_scanned += n
+        if self.progress is not None and self.nb_scanned >= self._next_report:
+            self._next_report = self.nb_scanned + self.batch_size
+            self.progress(self._diff, self.nb_scanned)
+
+    def scan(self, original, sauvegarde):
+        """Compare original and sauvegarde and return the Diff."""
+        diff = Diff(original, sauvegarde)
+        self._errors = diff.errors
+        self._diff = diff
+        self.nb_scanned = 0
+        self._next_report = self.batch_size
+        if self.index_file:
+            self._index = ScanIndex(self.index_file)
+        try:
+            self._compare(diff, original, sauvegarde, "", stat(original),
+                          stat(sauvegarde), True)
+        except OSError as e:
+            self._errors.append(str(e))
+        finally:
+            self.comparator.close()
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+        diff.cancelled = self._cancelled
+        if self.progress is not None:
+            self.progress(diff, self.nb_scanned)
+        return diff
+
+    def _walk(self, tree, parent, rel, excl):
+        """
+        Add the whole content of parent (rel is its path relative to the
+        root) to tree, except the entries matched by excl.
+        """
+        if self._cancelled:
+            return
+        try:
+            with scandir(parent) as content:
+                l = sorted(content, key=get_name)
+            self._tick(len(l))
+            for item in l:
+                nom = item.name
+                if item.is_symlink():
+                    if self.copy_links and not excl.match(rel, nom):
+                        tree.add(nom, LINK, WHOLE)
+                elif item.is_dir():
+                    # excluded subtrees are not listed at all
+                    if not excl.match(rel, nom, True):
+                        tree.enter(nom, DIR, WHOLE)
+                        self._walk(tree, item.path, join(rel, nom), excl)
+                        tree.leave()
+                elif not excl.match(rel, nom):
+                    tree.add(nom, FILE, WHOLE, self._size(item))
+        except NotADirectoryError:
+            pass
+        except Exception as e:
+            self._errors.append(str(e))
+
+    def _add_whole(self, tree, item, rel, excl, state=WHOLE):
+        """
+        Add item (DirEntry in folder rel) and its whole content to tree.
+        """
+        if item.is_symlink():
+            tree.add(item.name, LINK, state)
+        elif item.is_dir():
+            tree.enter(item.name, DIR, state)
+            self._walk(tree, item.path, join(rel, item.name), excl)
+            tree.leave()
+        else:
+            tree.add(item.name, FILE, state, self._size(item))
+
+    def _size(self, item):
+        """Return the size of file item (DirEntry) if recorded, else -1."""
+        if not self.sizes:
+            return -1
+        try:
+            return item.stat(follow_symlinks=False).st_size
+        except OSError:
+            return -1
+
+    def _listdir(self, path, entries, trusted):
+        """
+        Return the content of folder path, sorted with get_name.
+
+        entries: content of path stored in the index, None if path needs to
+                 be listed
+        trusted: whether the metadata stored in the index can be trusted
+        """
+        if entries is not None:
+            return [IndexEntry(path, *e, trusted) for e in entries]
+        with scandir(path) as content:
+            return sorted(content, key=get_name)
+
+    def _store(self, side, rel, st, listing, stats):
+        """Store listing in the index with the stat results in stats."""
+        entries = []
+        for item in listing:
+            s = stats.get(item.name)
+            if s is None:
+                entries.append((item.name, entry_kind(item), None, None, None,
+                                None))
+            else:
+                entries.append((item.name, entry_kind(item), s.st_size,
+                                s.st_mtime_ns, s.st_ino, s.st_dev))
+        self._index.put(side, rel, st.st_mtime_ns, entries)
+
+    def _compare(self, diff, orig, sauve, rel, st_o, st_s, search_supp):
+        """
+        Compare the content of orig and sauve (st_o and st_s are their stat
+        results, rel their path relative to the roots).
+
+        The sorted listings are merged in linear time, the entry types are
+        read from the DirEntry objects (no system call on most filesystems)
+        and each side is stat'ed at most once.
+        """
+        if self._cancelled:
+            return
+        entries_o = entries_s = None
+        trusted_o = False
+        if self._index is not None:
+            entries_o = self._index.get(ORIGINAL, rel, st_o.st_mtime_ns)
+            entries_s = self._index.get(SAUVEGARDE, rel, st_s.st_mtime_ns)
+            trusted_o = self.clean is not None and self.clean(rel)
+            if (entries_o is not None and entries_s is not None and
+                    [e[:2] for e in entries_o] == [e[:2] for e in entries_s]):
+                self._compare_same(diff, orig, sauve, rel, st_o, entries_o,
+                                   entries_s, trusted_o, search_supp)
+                return
+        try:
+            # the backup is normally only modified by the sync, so the
+            # metadata of its files stored in the index can be trusted
+            lo = self._listdir(orig, entries_o, trusted_o)
+            ls = self._listdir(sauve, entries_s, self.trust_backup)
+        except Exception as e:
+            self._errors.append(str(e))
+            return
+        stats_o = {}
+        stats_s = {}
+        excl_copie = self.exclude_copie
+        excl_supp = self.exclude_supp
+        self._tick(len(lo) + len(ls))
+        for item_o, item_s in merge(lo, ls):
+            if self._cancelled:
+                return
+            if item_o is None:
+                # the folder / file is not in the original
+                if search_supp and not excl_supp.match(rel, item_s.name,
+                                                       item_s.is_dir(follow_symlinks=False)):
+                    self._add_whole(diff.supp, item_s, rel, excl_supp)
+                continue
+            item = item_o.name
+            if excl_copie.match(rel, item, item_o.is_dir(follow_symlinks=False)):
+                continue
+            if item_s is None:
+                # the folder / file is not in the backup
+                if item_o.is_symlink():
+                    if self.copy_links:
+                        diff.copie.add(item, LINK, WHOLE)
+                else:
+                    self._add_whole(diff.copie, item_o, rel, excl_copie)
+                continue
+            try:
+                if item_o.is_symlink():
+                    # checking the existence prevents from copying broken links
+                    if self.copy_links and exists(item_o.path):
+                        if not item_s.is_symlink():
+                            diff.copie.add(item, LINK, CONFLICT)
+                        else:
+                            diff.copie.add(item, LINK, WHOLE)
+                elif item_o.is_file():
+                    # first check if item_s is also a file
+                    if item_s.is_file():
+                        so = stats_o[item] = item_o.stat(follow_symlinks=False)
+                        ss = stats_s[item] = item_s.stat()
+                        if self.comparator.is_modified(item_o.path, so,
+                                                       item_s.path, ss):
+                            # the file has been modified since the last backup
+                            diff.copie.add(item, FILE, MODIFIED, so.st_size)
+                    else:
+                        diff.copie.add(item, FILE, CONFLICT, self._size(item_o))
+                elif item_o.is_dir():
+                    # to avoid errors due to unrecognized item types (neither file nor folder nor link)
+                    if item_s.is_dir():
+                        diff.copie.enter(item)
+                        diff.supp.enter(item)
+                        self._compare(diff, item_o.path, item_s.path,
+                                      join(rel, item),
+                                      item_o.stat(follow_symlinks=False),
+                                      item_s.stat(),
+                                      search_supp and not excl_supp.match(rel, item, True))
+                        diff.copie.leave()
+                        diff.supp.leave()
+                    else:
+                        self._add_whole(diff.copie, item_o, rel, excl_copie,
+                                        CONFLICT)
+            except OSError as e:
+                self._errors.append(str(e))
+        if self._index is not None and not self._cancelled:
+            # the original is stored even if its content did not change to
+            # keep the metadata of its files up to date for the watch mode
+            self._store(ORIGINAL, rel, st_o, lo, stats_o)
+            if entries_s is None:
+                self._store(SAUVEGARDE, rel, st_s, ls, stats_s)
+
+    def _compare_same(self, diff, orig, sauve, rel, st_o, entries_o,
+                      entries_s, trusted_o, search_supp):
+        """
+        Compare orig and sauve when both folders did not change since the
+        last scan and contain the same entries (entries_o and entries_s
+        are their contents stored in the index).
+
+        Only the files of the original are stat'ed, to detect modifications,
+        unless trusted_o is True, and the ones of the backup if its metadata
+        is not trusted.
+        """
+        self._tick(2 * len(entries_o))
+        modified = []
+        excl_copie = self.exclude_copie
+        excl_supp = self.exclude_supp
+        prefix_o = join(orig, "")
+        prefix_s = join(sauve, "")
+        for entry_o, entry_s in zip(entries_o, entries_s):
+            if self._cancelled:
+                return
+            item, kind = entry_o[:2]
+            if excl_copie.match(rel, item, kind == DIR):
+                continue
+            chemin_o = prefix_o + item
+            try:
+                if kind == FILE:
+                    chemin_s = prefix_s + item
+                    if entry_s[3] is None or not self.trust_backup:
+                        ss = stat(chemin_s)
+                    else:
+                        ss = CachedStat(*entry_s[2:])
+                    if not trusted_o or entry_o[3] is None:
+                        so = lstat(chemin_o)
+                        if (so.st_mtime_ns, so.st_size) != (entry_o[3], entry_o[2]):
+                            modified.append((item, FILE, so.st_size,
+                                             so.st_mtime_ns, so.st_ino,
+                                             so.st_dev))
+                    else:
+                        so = CachedStat(*entry_o[2:])
+                    if self.comparator.is_modified(chemin_o, so, chemin_s, ss):
+                        # the file has been modified since the last backup
+                        diff.copie.add(item, FILE, MODIFIED, so.st_size)
+                elif kind == DIR:
+                    chemin_s = prefix_s + item
+                    diff.copie.enter(item)
+                    diff.supp.enter(item)
+                    self._compare(diff, chemin_o, chemin_s, join(rel, item),
+                                  lstat(chemin_o), stat(chemin_s),
+                                  search_supp and not excl_supp.match(rel, item, True))
+                    diff.copie.leave()
+                    diff.supp.leave()
+                elif kind == LINK:
+                    # checking the existence prevents from copying broken links
+                    if self.copy_links and exists(chemin_o):
+                        diff.copie.add(item, LINK, WHOLE)
+            except OSError as e:
+                self._errors.append(str(e))
+        if modified and not self._cancelled:
+            # update the metadata of the modified files in the index
+            changes = {e[0]: e for e in modified}
+            self._index.put(ORIGINAL, rel, st_o.st_mtime_ns,
+                            [changes.get(e[0], e) for e in entries_o])
@@ -0,0 +1,181 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+FolderSync - Folder synchronization software
+Copyright 2017-2018 Juliette Monsel <j_4321@protonmail.com>
+
+FolderSync is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FolderSync is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Persistent scan index: content of the folders of an (original, backup) pair
+as seen during the last scan, so that the folders that did not change are
+not listed again.
+"""
+
+import sqlite3
+from marshal import dumps, loads
+from hashlib import sha1
+from os import stat, lstat
+from os.path import join, isfile, isdir
+from time import time_ns
+from foldersynclib.diff import FILE, DIR, LINK
+
+# sides of the pair
+ORIGINAL = 0
+SAUVEGARDE = 1
+
+# bump when the format of the stored entries changes
+VERSION = 2
+
+# folders modified less than RACY_DELAY ns before being listed can still be
+# modified within the same mtime tick, so they are not stored
+RACY_DELAY = 2000000000
+
+
+def index_file(folder, original, sauvegarde):
+    """Return the path of the index file of the pair in folder."""
+    key = sha1(("%s\0%s" % (original, sauvegarde)).encode()).hexdigest()
+    return join(folder, "%s.db" % key[:16])
+
+
+def entry_kind(item):
+    """Return the kind of item (DirEntry) without following symlinks."""
+    if item.is_symlink():
+        return LINK
+    elif item.is_dir(follow_symlinks=False):
+        return DIR
+    elif item.is_file(follow_symlinks=False):
+        return FILE
+    return None
+
+
+class CachedStat:
+    """Stat result stored in the index."""
+
+    __slots__ = ("st_size", "st_mtime_ns", "st_ino", "st_dev")
+
+    def __init__(self, st_size, st_mtime_ns, st_ino, st_dev):
+        self.st_size = st_size
+        self.st_mtime_ns = st_mtime_ns
+        self.st_ino = st_ino
+        self.st_dev = st_dev
+
+    @property
+    def st_mtime(self):
+        return self.st_mtime_ns / 1e9
+
+
+class IndexEntry:
+    """
+    DirEntry-like object built from the scan index.
+
+    The stat result stored in the index is only returned if the entry is
+    trusted, otherwise the file is stat'ed again.
+    """
+
+    __slots__ = ("name", "folder", "kind", "_stat")
+
+    def __init__(self, folder, name, kind, size, mtime_ns, ino, dev, trusted):
+        self.name = name
+        self.folder = folder
+        self.kind = kind
+        if trusted and mtime_ns is not None:
+            self._stat = CachedStat(size, mtime_ns, ino, dev)
+        else:
+            self._stat = None
+
+    @property
+    def path(self):
+        return join(self.folder, self.name)
+
+    def is_symlink(self):
+        return self.kind == LINK
+
+    def is_dir(self, follow_symlinks=True):
+        if self.kind == LINK:
+            return follow_symlinks and isdir(self.path)
+        return self.kind == DIR
+
+    def is_file(self, follow_symlinks=True):
+        if self.kind == LINK:
+            return follow_symlinks and isfile(self.path)
+        return self.kind == FILE
+
+    def stat(self, follow_symlinks=True):
+        if self._stat is None or self.kind != FILE:
+            if follow_symlinks:
+                return stat(self.path)
+            return lstat(self.path)
+        return self._stat
+
+
+class ScanIndex:
+    """
+    Scan index of an (original, backup) pair stored in an SQLite database.
+
+    For each folder of each side (ORIGINAL or SAUVEGARDE), identified by
+    its path relative to the root of the side, the index stores the mtime
+    of the folder and the list of its entries as
+    (name, kind, size, mtime_ns, inode, device) tuples, sorted like the scan
+    listings (size, mtime_ns, inode and device are None if the entry was
+    not stat'ed during the scan).
+    """
+
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != VERSION:
+            self.db.execute("DROP TABLE IF EXISTS dirs")
+            self.db.execute("PRAGMA user_version = %i" % VERSION)
+        self.db.execute("CREATE TABLE IF NOT EXISTS dirs "
+                        "(side INTEGER, path TEXT, mtime INTEGER, entries BLOB, "
+                        "PRIMARY KEY (side, path))")
+        self._pending = []
+
+    def get(self, side, path, mtime_ns):
+        """
+        Return the entries of folder path stored in the index if its mtime
+        is still mtime_ns, None otherwise.
+        """
+        row = self.db.execute("SELECT mtime, entries FROM dirs "
+                              "WHERE side=? AND path=?", (side, path)).fetchone()
+        if row is None or row[0] != mtime_ns:
+            return None
+        return loads(row[1])
+
+    def put(self, side, path, mtime_ns, entries):
+        """Store the entries of folder path."""
+        if time_ns() - mtime_ns < RACY_DELAY:
+            return
+        self._pending.append((side, path, mtime_ns, dumps(entries)))
+        if len(self._pending) >= 1000:
+            self.flush()
+
+    def flush(self):
+        """Write the pending entries in the database."""
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)",
+                                self._pending)
+        self._pending.clear()
+
+    def invalidate(self, side, paths):
+        """Forget the folders in paths, their parents and their descendants."""
+        with self.db:
+            for path in paths:
+                parent = path.rpartition("/")[0]
+                self.db.execute("DELETE FROM dirs WHERE side=? AND "
+                                "(path=? OR path=? OR (path>=? AND path<?))",
+                                (side, parent, path, path + "/", path + "0"))
+
+    def close(self):
+        self.flush()
+        self.db.close()
@@ -0,0 +1,372 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+FolderSync - Folder synchronization software
+Copyright 2017-2018 Juliette Monsel <j_4321@protonmail.com>
+
+FolderSync is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FolderSync is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Removal engine: in-process equivalent of 'rm -r'
+"""
+
+import os
+import stat as st_
+from collections import deque
+from errno import EXDEV
+from datetime import datetime, timedelta
+from os.path import join, dirname, relpath
+from threading import Thread, Condition, Lock
+
+from foldersynclib.copie import is_rotational
+
+DIR_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+# quarantine folder, at the root of the backup
+TRASH_DIR = ".Trash-foldersync"
+TRASH_DATE = "%Y-%m-%d_%H-%M-%S"
+
+
+class _Folder:
+    """Folder whose content is being removed."""
+
+    __slots__ = ("path", "parent", "index", "pending", "failed")
+
+    def __init__(self, path, parent=None, index=None):
+        self.path = path
+        self.parent = parent  # None for the entries given to run()
+        self.index = index
+        self.pending = 1  # own content + subfolders handled by other workers
+        self.failed = False  # for the entries given to run()
+
+
+class Remover:
+    """
+    Remove entries and their content with a pool of worker threads.
+
+    Inside a folder, the entries are removed relatively to the file
+    descriptor of the folder (unlinkat/rmdir with dir_fd) so that their
+    path is not resolved again, and links are removed, never followed.
+    When some workers are idle, the subfolders of the folder being
+    emptied are handed to them, so that a single large tree is also
+    removed in parallel. On a spinning disk, only hdd_workers workers
+    are used.
+
+    The errors are logged with logger, like 'rm -r' the removal goes on
+    with the other entries, and they are counted in nb_errors.
+
+    entry_done: function called from the workers with the index (in the
+                list given to run()) of each entry whose removal is over
+                (not called if some of its content could not be removed)
+    throttle: Throttle limiting the number of entries removed per second
+    progress: Progress counting the files (folders excluded) and the bytes
+              of the regular files removed
+    """
+
+    def __init__(self, logger=None, workers=4, hdd_workers=1,
+                 entry_done=None, throttle=None, progress=None):
+        self.logger = logger
+        self.throttle = throttle
+        self.progress = progress
+        self.workers = max(1, workers)
+        self.hdd_workers = max(1, hdd_workers)
+        self.entry_done = entry_done
+        self.nb_errors = 0
+        self._cond = Condition()
+        self._tasks = deque()
+        self._idle = 0
+        self._closed = False
+        self._log = None
+
+    def error(self, path, e, folder=None):
+        """Record the error e on path, inside folder (_Folder) if given."""
+        with self._cond:
+            self.nb_errors += 1
+            if folder is not None:
+                while folder.parent is not None:
+                    folder = folder.parent
+                folder.failed = True
+        if self.logger is not None:
+            self.logger.error("cannot remove '%s': %s" % (path, e.strerror or e))
+
+    def _get(self):
+        """Return the next folder to empty, None when there is none left."""
+        with self._cond:
+            self._idle += 1
+            while not self._tasks:
+                if self._closed:
+                    self._idle -= 1
+                    return None
+                self._cond.wait()
+            self._idle -= 1
+            return self._tasks.popleft()
+
+    def _put(self, folder):
+        with self._cond:
+            if folder.parent is not None:
+                folder.parent.pending += 1
+            self._tasks.append(folder)
+            self._cond.notify()
+
+    def _folder_done(self, folder):
+        """
+        Remove folder once its content is removed, then its parent if it
+        was waiting for it.
+        """
+        while True:
+            with self._cond:
+                folder.pending -= 1
+                if folder.pending:
+                    return
+            if folder.parent is None:
+                # entry given to run()
+                if self.entry_done is not None and not folder.failed:
+                    self.entry_done(folder.index)
+                return
+            try:
+                os.rmdir(folder.path)
+                self._removed(0)
+            except OSError as e:
+                self.error(folder.path, e, folder)
+            folder = folder.parent
+
+    def _removed(self, files=1, size=0):
+        """Record that an entry was removed (files: 0 for a folder)."""
+        if self.progress is not None and files:
+            self.progress.add(files, size)
+        if self.throttle is not None:
+            self.throttle.consume(files=1)
+
+    def _size(self, item):
+        """Return the size of item (DirEntry) counted by the progress."""
+        if self.progress is None or not item.is_file(follow_symlinks=False):
+            return 0
+        return item.stat(follow_symlinks=False).st_size
+
+    def _worker(self):
+        if self.throttle is not None:
+            self.throttle.started()
+        while True:
+            folder = self._get()
+            if folder is None:
+                return
+            if folder.parent is None:
+                self._remove_entry(folder)
+            else:
+                self._empty_folder(folder)
+
+    def _remove_entry(self, entry):
+        """Remove entry given to run()."""
+        if self._log is not None:
+            self._log(entry.path)
+        try:
+            st = os.lstat(entry.path)
+            if not st_.S_ISDIR(st.st_mode):
+                os.unlink(entry.path)
+                self._removed(1, st.st_size if st_.S_ISREG(st.st_mode) else 0)
+            else:
+                entry.pending += 1
+                self._empty_folder(_Folder(entry.path, entry))
+        except OSError as e:
+            self.error(entry.path, e, entry)
+        self._folder_done(entry)
+
+    def _empty_folder(self, folder):
+        try:
+            fd = os.open(folder.path, DIR_FLAGS)
+        except OSError as e:
+            self.error(folder.path, e, folder)
+        else:
+            try:
+                self._empty(fd, folder.path, folder)
+            except OSError as e:
+                self.error(folder.path, e, folder)
+            finally:
+                os.close(fd)
+        self._folder_done(folder)
+
+    def _empty(self, fd, path, folder):
+        """
+        Remove the content of folder, open as fd. Its subfolders are handed
+        to the idle workers, if any, the deeper ones are emptied here (with
+        an explicit stack, the trees can be deeper than the recursion
+        limit).
+        """
+        stack = []  # (fd, path, remaining items, name) of the parents
+        with os.scandir(fd) as content:
+            items = deque(content)
+        while True:
+            while items:
+                item = items.popleft()
+                try:
+                    if not item.is_dir(follow_symlinks=False):
+                        size = self._size(item)
+                        os.unlink(item.name, dir_fd=fd)
+                        self._removed(1, size)
+                    elif not stack and self._idle:
+                        self._put(_Folder(join(path, item.name), folder))
+                    else:
+                        sub = os.open(item.name, DIR_FLAGS, dir_fd=fd)
+                        try:
+                            with os.scandir(sub) as content:
+                                sub_items = deque(content)
+                        except OSError:
+                            os.close(sub)
+                            raise
+                        stack.append((fd, path, items, item.name))
+                        fd, path, items = sub, join(path, item.name), sub_items
+                except OSError as e:
+                    self.error(join(path, item.name), e, folder)
+            if not stack:
+                return
+            os.close(fd)
+            fd, path, items, name = stack.pop()
+            try:
+                os.rmdir(name, dir_fd=fd)
+                self._removed(0)
+            except OSError as e:
+                self.error(join(path, name), e, folder)
+
+    def run(self, paths, log=None):
+        """
+        Remove paths and their content, return the number of errors. log is
+        called with each path before it is handled.
+        """
+        if not paths:
+            return 0
+        self._log = log
+        workers = self.workers
+        try:
+            if is_rotational(os.lstat(paths[0]).st_dev):
+                workers = self.hdd_workers
+        except OSError:
+            pass
+        self._closed = False
+        threads = [Thread(target=self._worker, name="supp%i" % k, daemon=True)
+                   for k in range(workers)]
+        for t in threads:
+            t.start()
+        for i, path in enumerate(paths):
+            self._put(_Folder(path, index=i))
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for t in threads:
+            t.join()
+        return self.nb_errors
+
+
+class Quarantine:
+    """
+    Quarantine of the entries removed from the backup sauvegarde.
+
+    Instead of being removed, the entries are renamed into a dated folder
+    of TRASH_DIR (at the same relative path), which is immediate whatever
+    their size, and can be restored from there until the folder is purged.
+    The folder is created by the first move, with a '.<n>' suffix if a
+    folder of the same date exists, so that a quarantined entry is never
+    overwritten. It can be used from several threads.
+    """
+
+    def __init__(self, sauvegarde, logger=None, throttle=None):
+        self.sauvegarde = sauvegarde
+        self.logger = logger
+        self.throttle = throttle
+        self.trash = join(sauvegarde, TRASH_DIR)
+        self.folder = None
+        self._lock = Lock()
+
+    def _create_folder(self):
+        """Create the quarantine folder of this synchronization."""
+        os.makedirs(self.trash, exist_ok=True)
+        name = datetime.now().strftime(TRASH_DATE)
+        folder = join(self.trash, name)
+        n = 0
+        while True:
+            try:
+                os.mkdir(folder)
+            except FileExistsError:
+                n += 1
+                folder = join(self.trash, "%s.%i" % (name, n))
+            else:
+                return folder
+
+    def move(self, path):
+        """
+        Move path (in sauvegarde) to the quarantine and return its new path.
+        Raise OSError(EXDEV) if it is on another filesystem (mount point
+        inside the backup).
+        """
+        with self._lock:
+            if self.folder is None:
+                self.folder = self._create_folder()
+        dst = join(self.folder, relpath(path, self.sauvegarde))
+        os.makedirs(dirname(dst), exist_ok=True)
+        os.rename(path, dst)
+        return dst
+
+    def move_all(self, paths, logger, entry_done=None):
+        """
+        Move paths to the quarantine, logging them and the errors with
+        logger. Return the indexes of the paths on another filesystem, which
+        have to be removed, and the number of errors.
+
+        entry_done: function called with the index of each moved path
+        """
+        remaining = []
+        nb_errors = 0
+        for i, path in enumerate(paths):
+            try:
+                dst = self.move(path)
+            except OSError as e:
+                if e.errno == EXDEV:
+                    remaining.append(i)
+                else:
+                    logger.error("%s: %s" % (path, e))
+                    nb_errors += 1
+            else:
+                logger.info("%s -> %s" % (path, dst))
+                if entry_done is not None:
+                    entry_done(i)
+        return remaining, nb_errors
+
+    def expired(self, days):
+        """Return the quarantine folders older than days."""
+        try:
+            names = os.listdir(self.trash)
+        except FileNotFoundError:
+            return []
+        limit = datetime.now() - timedelta(days=days)
+        folders = []
+        for name in sorted(names):
+            date, sep, n = name.partition(".")
+            try:
+                if sep and not n.isdigit():
+                    raise ValueError(name)
+                date = datetime.strptime(date, TRASH_DATE)
+            except ValueError:
+                # not created by the quarantine
+                continue
+            if date < limit:
+                folders.append(join(self.trash, name))
+        return folders
+
+    def purge(self, days, workers=1):
+        """Remove the quarantine folders older than days."""
+        folders = self.expired(days)
+        if folders:
+            Remover(self.logger, workers, workers,
+                    throttle=self.throttle).run(folders, self._log)
+
+    def _log(self, path):
+        if self.logger is not None:
+            self.logger.info("purge %s" % path)
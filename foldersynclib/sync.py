@@ -20,27 +20,43 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 Main GUI
 """
 
-from os.path import join, splitext, exists, isdir, islink, isfile, getmtime, abspath, commonpath
-from os import scandir, listdir, chdir, getpid, remove, unlink
-from re import split, search, match
+from os.path import join, exists, abspath, relpath
+from os import listdir, getpid, remove, unlink
+from re import search, match
 from threading import Thread
 from queue import Queue
-from subprocess import run, PIPE
 from tkinter import Tk, PhotoImage, Menu, BooleanVar, StringVar
 from tkinter.ttk import Label, Button, PanedWindow, Entry, Style, Frame, Progressbar
-from tkinter.messagebox import showerror, askokcancel, showwarning, showinfo
+from tkinter.messagebox import showerror, askokcancel, showwarning, showinfo, \
+    askyesno
 from foldersynclib.checkboxtreeview import CheckboxTreeview
 from foldersynclib.scrollbar import AutoScrollbar as Scrollbar
 from foldersynclib.tooltip import TooltipWrapper, TooltipMenuWrapper
 from foldersynclib.constants import FAVORIS, RECENT, CONFIG, askdirectory, \
     IM_OPEN, IM_PLUS, IM_MOINS, IM_ICON, IM_ABOUT, IM_PREV, IM_SYNC, IM_EXPAND, \
     IM_COLLAPSE, LOG_COPIE, LOG_SUPP, PID_FILE, save_config, setup_logger, PATH, \
-    open_file, notification_send
+    open_file, notification_send, INDEX_PATH, HASH_FILE, convert_size, \
+    JOURNAL_PATH
 from foldersynclib.confirmation import Confirmation
+from foldersynclib.scan import Scanner
+from foldersynclib.throttle import Throttle
+from foldersynclib.suppression import Remover, Quarantine, TRASH_DIR
+from foldersynclib.copie import Copier, CopyPool, Durability, FSYNC_NONE, \
+    FSYNC_FILE, FSYNC_BATCH
+from foldersynclib.journal import Journal, journal_file, pending_journals, \
+    COPIE, SUPP, SUPP_AVANT_CP
+from foldersynclib.progress import Progress, Throughput, tree_size, \
+    format_duration
+from foldersynclib.diff import Diff, DIR, PARTIAL
+from foldersynclib.matcher import ExclusionMatcher, parse_patterns
+from foldersynclib.compare import Comparator, MTIME, SIZE_MTIME, CHECKSUM
+from foldersynclib.scanindex import ScanIndex, index_file, SAUVEGARDE
+from foldersynclib.watch import Watcher, INOTIFY
 from foldersynclib.about import About
 from foldersynclib.exclusions_copie import ExclusionsCopie
 from foldersynclib.exclusions_supp import ExclusionsSupp
 from datetime import datetime
+from time import monotonic
 
 
 class Sync(Tk):
@@ -102,31 +118,32 @@ class Sync(Tk):
         self.logger_copie.info("\n###  %s  ###\n" % date)
         self.logger_supp.info("\n###  %s  ###\n" % date)
 
-        # --- filenames and extensions that will not be copied
-        exclude_list = split(r'(?<!\\) ',
-                             CONFIG.get("Defaults", "exclude_copie"))
-        self.exclude_names = []
-        self.exclude_ext = []
-        for elt in exclude_list:
-            if elt:
-                if elt[:2] == "*.":
-                    self.exclude_ext.append(elt[1:])
-                else:
-                    self.exclude_names.append(elt.replace("\ ", " "))
-
-        # --- paths that will not be deleted
-        self.exclude_path_supp = [ch.replace("\ ", " ") for ch in
-                                  split(r'(?<!\\) ',
-                                        CONFIG.get("Defaults", "exclude_supp"))
-                                  if ch]
-#        while "" in self.exclude_path_supp:
-#            self.exclude_path_supp.remove("")
+        # --- patterns of the files / folders that will not be copied
+        self.exclude_copie = ExclusionMatcher(
+            parse_patterns(CONFIG.get("Defaults", "exclude_copie")))
+
+        # --- paths / patterns that will not be deleted
+        self.exclude_supp = parse_patterns(CONFIG.get("Defaults", "exclude_supp"))
 
         self.q_copie = Queue()
         self.q_supp = Queue()
+        self._progress = {}   # progress bar -> totals and throughput
         # True if a copy / deletion is running
         self.is_running_copie = False
         self.is_running_supp = False
+        # scan results sent by the scanning thread
+        self.q_scan = Queue()
+        self.scanner = None
+        self._scan_width = {}
+        self._displayed = {}   # tree -> index of the next entry to display
+        self.diff = None
+        # watch mode: changes in the original of the displayed favorite
+        self.watcher = None
+        self._watch_id = None  # next check of the watcher
+        self._quiet_scan = False
+        # boxes changed by the user since the last scan: the automatic scans
+        # would lose the selection
+        self._edited = False
 
         self.style = Style(self)
         self.style.theme_use("clam")
@@ -180,6 +197,59 @@ class Sync(Tk):
         menu_params.add_checkbutton(label=_("Show total size"),
                                     variable=self.show_size,
                                     command=self.toggle_show_size)
+        self.watch = BooleanVar(self, value=CONFIG.getboolean("Defaults", "watch"))
+        menu_params.add_checkbutton(label=_("Watch favorites for changes"),
+                                    variable=self.watch,
+                                    command=self.toggle_watch)
+        if not INOTIFY:
+            self.watch.set(False)
+            menu_params.entryconfigure(2, state="disabled")
+        self.quarantine = BooleanVar(self, value=CONFIG.getboolean("Defaults", "quarantine"))
+        menu_params.add_checkbutton(label=_("Keep the removed files in quarantine"),
+                                    variable=self.quarantine,
+                                    command=self.toggle_quarantine)
+        self.low_priority = BooleanVar(self, value=CONFIG.getboolean("Defaults", "low_priority"))
+        menu_params.add_checkbutton(label=_("Low priority"),
+                                    variable=self.low_priority,
+                                    command=self.toggle_low_priority)
+        self.adaptive = BooleanVar(self, value=CONFIG.getboolean("Defaults", "adaptive"))
+        menu_params.add_checkbutton(label=_("Slow down when the disk is busy"),
+                                    variable=self.adaptive,
+                                    command=self.toggle_adaptive)
+        self.delta = BooleanVar(self, value=CONFIG.getboolean("Defaults", "delta"))
+        menu_params.add_checkbutton(label=_("Only rewrite the changed blocks of large files"),
+                                    variable=self.delta,
+                                    command=self.toggle_delta)
+        self.scan_index = BooleanVar(self, value=CONFIG.getboolean("Defaults", "scan_index"))
+        menu_params.add_checkbutton(label=_("Skip the unchanged folders when scanning"),
+                                    variable=self.scan_index,
+                                    command=self.toggle_scan_index)
+        self.compare_mode = StringVar(self, CONFIG.get("Defaults", "compare"))
+        menu_compare = Menu(menu_params, tearoff=False)
+        menu_compare.add_radiobutton(label=_("Modification time"), value=MTIME,
+                                     variable=self.compare_mode,
+                                     command=self.change_compare_mode)
+        menu_compare.add_radiobutton(label=_("Size and modification time"),
+                                     value=SIZE_MTIME,
+                                     variable=self.compare_mode,
+                                     command=self.change_compare_mode)
+        menu_compare.add_radiobutton(label=_("Content (checksum)"),
+                                     value=CHECKSUM,
+                                     variable=self.compare_mode,
+                                     command=self.change_compare_mode)
+        menu_params.add_cascade(label=_("File comparison"), menu=menu_compare)
+        self.fsync = StringVar(self, CONFIG.get("Defaults", "fsync"))
+        menu_fsync = Menu(menu_params, tearoff=False)
+        menu_fsync.add_radiobutton(label=_("Left to the system"),
+                                   value=FSYNC_NONE, variable=self.fsync,
+                                   command=self.change_fsync)
+        menu_fsync.add_radiobutton(label=_("After each file"),
+                                   value=FSYNC_FILE, variable=self.fsync,
+                                   command=self.change_fsync)
+        menu_fsync.add_radiobutton(label=_("By batches of files"),
+                                   value=FSYNC_BATCH, variable=self.fsync,
+                                   command=self.change_fsync)
+        menu_params.add_cascade(label=_("Write to disk"), menu=menu_fsync)
         self.langue = StringVar(self, CONFIG.get("Defaults", "language"))
         menu_lang = Menu(menu_params, tearoff=False)
         menu_lang.add_radiobutton(label="English", value="en",
@@ -267,7 +337,8 @@ class Sync(Tk):
         frame_copie.grid(row=3, column=0, sticky="eswn", columnspan=2,
                          pady=(2, 4), padx=(10, 4))
         self.tree_copie = CheckboxTreeview(frame_copie, selectmode='none',
-                                           show='tree')
+                                           show='tree',
+                                           populate=lambda item: self.populate(self.tree_copie, self.diff.copie, item))
         self.b_expand_copie = Button(f_left, image=self.img_expand,
                                      style="folder.TButton",
                                      command=self.tree_copie.expand_all)
@@ -294,9 +365,11 @@ class Sync(Tk):
                                   xscrollcommand=self.scroll_x_copie.set)
         self.pbar_copie = Progressbar(frame_left, orient="horizontal",
                                       mode="determinate")
-        self.pbar_copie.grid(row=4, columnspan=2, sticky="ew",
+        self.pbar_copie.grid(row=4, column=0, sticky="ew",
                              padx=(10, 4), pady=4)
         self.pbar_copie.state(("disabled", ))
+        self.label_copie = Label(frame_left)
+        self.label_copie.grid(row=4, column=1, sticky="e", padx=(0, 4))
 
         # --- right side
         frame_right = Frame(paned)
@@ -314,7 +387,8 @@ class Sync(Tk):
         frame_supp.columnconfigure(0, weight=1)
         frame_supp.grid(row=3, columnspan=2, sticky="eswn", pady=(2, 4), padx=(4, 10))
         self.tree_supp = CheckboxTreeview(frame_supp, selectmode='none',
-                                          show='tree')
+                                          show='tree',
+                                          populate=lambda item: self.populate(self.tree_supp, self.diff.supp, item))
         self.b_expand_supp = Button(f_right, image=self.img_expand,
                                     style="folder.TButton",
                                     command=self.tree_supp.expand_all)
@@ -338,35 +412,73 @@ class Sync(Tk):
                                  xscrollcommand=self.scroll_x_supp.set)
         self.pbar_supp = Progressbar(frame_right, orient="horizontal",
                                      mode="determinate")
-        self.pbar_supp.grid(row=4, columnspan=2, sticky="ew",
+        self.pbar_supp.grid(row=4, column=0, sticky="ew",
                             padx=(4, 10), pady=4)
         self.pbar_supp.state(("disabled", ))
+        self.label_supp = Label(frame_right)
+        self.label_supp.grid(row=4, column=1, sticky="e", padx=(0, 10))
+
+        # --- scan status
+        self.frame_scan = Frame(self)
+        self.frame_scan.columnconfigure(0, weight=1)
+        self.frame_scan.grid(row=3, sticky="ew", padx=10, pady=(0, 4))
+        self.label_scan = Label(self.frame_scan)
+        self.label_scan.grid(row=0, column=0, sticky="w")
+        self.b_cancel_scan = Button(self.frame_scan, text=_("Cancel"),
+                                    command=self.cancel_scan)
+        self.b_cancel_scan.grid(row=0, column=1, sticky="e")
+        self.frame_scan.grid_remove()
 
         # --- bindings
         self.entry_orig.bind("<Key-Return>", self.list_files_to_sync)
         self.entry_sauve.bind("<Key-Return>", self.list_files_to_sync)
+        self.tree_copie.bind("<<CheckboxToggled>>", self.trees_edited)
+        self.tree_supp.bind("<<CheckboxToggled>>", self.trees_edited)
+
+        # --- interrupted synchronizations
+        self.journal = None
+        self.after(500, self.check_journals)
+
+    def check_journals(self):
+        """Offer to resume the synchronizations that were interrupted."""
+        for journal in pending_journals(JOURNAL_PATH):
+            rep = askyesno(_("Resume"),
+                           _("The synchronization from %(original)s to %(backup)s was interrupted. Do you want to resume it?") % {'original': journal.original, 'backup': journal.sauvegarde},
+                           master=self)
+            if not rep:
+                journal.close(True)
+                continue
+            journal.close()
+            self.entry_orig.delete(0, "end")
+            self.entry_orig.insert(0, journal.original)
+            self.entry_sauve.delete(0, "end")
+            self.entry_sauve.insert(0, journal.sauvegarde)
+            if journal.unchanged():
+                self.original = journal.original
+                self.sauvegarde = journal.sauvegarde
+                self.copie_supp(journal.remaining(COPIE),
+                                journal.remaining(SUPP),
+                                journal.remaining(SUPP_AVANT_CP), resume=True)
+            else:
+                showinfo(_("Information"),
+                         _("Some files to copy changed since the synchronization was interrupted, the folders will be compared again."),
+                         master=self)
+                journal.close(True)
+                self.list_files_to_sync()
+            # the other journals will be proposed at the next start
+            break
 
     def exclusion_supp(self):
         excl = ExclusionsSupp(self)
         self.wait_window(excl)
         # paths that will not be deleted
-        self.exclude_path_supp = [ch.replace("\ ", " ") for ch in
-                                  split(r'(?<!\\) ',
-                                        CONFIG.get("Defaults", "exclude_supp"))
-                                  if ch]
+        self.exclude_supp = parse_patterns(CONFIG.get("Defaults", "exclude_supp"))
 
     def exclusion_copie(self):
         excl = ExclusionsCopie(self)
         self.wait_window(excl)
-        exclude_list = CONFIG.get("Defaults", "exclude_copie").split(" ")
-        self.exclude_names = []
-        self.exclude_ext = []
-        for elt in exclude_list:
-            if elt:
-                if elt[:2] == "*.":
-                    self.exclude_ext.append(elt[2:])
-                else:
-                    self.exclude_names.append(elt)
+        self.exclude_copie = ExclusionMatcher(
+            parse_patterns(CONFIG.get("Defaults", "exclude_copie")))
 
     def toggle_copy_links(self):
         CONFIG.set("Defaults", "copy_links", str(self.copy_links.get()))
@@ -374,6 +486,80 @@ class Sync(Tk):
     def toggle_show_size(self):
         CONFIG.set("Defaults", "show_size", str(self.show_size.get()))
 
+    def toggle_delta(self):
+        CONFIG.set("Defaults", "delta", str(self.delta.get()))
+
+    def toggle_scan_index(self):
+        CONFIG.set("Defaults", "scan_index", str(self.scan_index.get()))
+
+    def toggle_quarantine(self):
+        CONFIG.set("Defaults", "quarantine", str(self.quarantine.get()))
+
+    def toggle_low_priority(self):
+        CONFIG.set("Defaults", "low_priority", str(self.low_priority.get()))
+
+    def toggle_adaptive(self):
+        CONFIG.set("Defaults", "adaptive", str(self.adaptive.get()))
+
+    def change_compare_mode(self):
+        CONFIG.set("Defaults", "compare", self.compare_mode.get())
+
+    def change_fsync(self):
+        CONFIG.set("Defaults", "fsync", self.fsync.get())
+
+    def toggle_watch(self):
+        CONFIG.set("Defaults", "watch", str(self.watch.get()))
+        if not self.watch.get():
+            self.stop_watch()
+        elif self.original:
+            self.start_watch()
+
+    def start_watch(self):
+        """Watch the original of the displayed pair if it is a favorite."""
+        watch = (self.watch.get() and
+                 (self.original, self.sauvegarde) in FAVORIS)
+        if self.watcher is not None:
+            if watch and self.watcher.root == self.original:
+                return
+            self.stop_watch()
+        if watch:
+            self.watcher = Watcher(self.original)
+            self.watcher.start()
+            self.check_watch()
+
+    def stop_watch(self):
+        if self._watch_id is not None:
+            self.after_cancel(self._watch_id)
+            self._watch_id = None
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    def check_watch(self):
+        """
+        Scan again the pair in watch mode once the changes in the original
+        have settled, so that the displayed diff stays up to date.
+        """
+        self._watch_id = None
+        watcher = self.watcher
+        if watcher is None:
+            return
+        if (watcher.nb_changes and monotonic() - watcher.last_event > 2 and
+                self.scanner is None and not self.is_running_copie and
+                not self.is_running_supp and self.grab_current() is None):
+            if self._edited:
+                # keep the selection of the user, only tell that the list
+                # is outdated (it is scanned again by pressing Enter)
+                self.label_scan.configure(text=_("The original folder has changed since the scan, press Enter in the path entries to scan it again."))
+                self.b_cancel_scan.grid_remove()
+                self.frame_scan.grid()
+            else:
+                self.start_scan(True)
+        self._watch_id = self.after(1000, self.check_watch)
+
+    def trees_edited(self, event=None):
+        self._edited = True
+
     def open_log_copie(self):
         open_file(self.log_copie)
 
@@ -431,166 +617,114 @@ class Sync(Tk):
             self.entry_orig.insert(0, original)
 
     def sync(self, original, sauvegarde):
-        """ peuple tree_copie avec l'arborescence des fichiers d'original à copier
-            vers sauvegarde et tree_supp avec celle des fichiers de sauvegarde à
-            supprimer """
-        errors = []
-        copy_links = self.copy_links.get()
-        excl_supp = [path for path in self.exclude_path_supp if commonpath([path, sauvegarde]) == sauvegarde]
-
-        def get_name(elt):
-            return elt.name.lower()
-
-        def lower(char):
-            return char.lower()
-
-        def arbo(tree, parent, n):
-            """ affiche l'arborescence complète de parent et renvoie la longueur
-                maximale des items (pour gérer la scrollbar horizontale) """
-            m = 0
-            try:
-                with scandir(parent) as content:
-                    l = sorted(content, key=get_name)
-                for item in l:
-                    chemin = item.path
-                    nom = item.name
-                    if item.is_symlink():
-                        if copy_links:
-                            tree.insert(parent, 'end', chemin, text=nom,
-                                        tags=("whole", "link"))
-                            m = max(m, len(nom) * 9 + 20 * (n + 1))
-                    elif ((nom not in self.exclude_names) and
-                          (splitext(nom)[-1] not in self.exclude_ext)):
-                        tree.insert(parent, 'end', chemin, text=nom, tags=("whole", ))
-                        m = max(m, len(nom) * 9 + 20 * (n + 1))
-                        if item.is_dir():
-                            m = max(m, arbo(tree, chemin, n + 1))
-            except NotADirectoryError:
-                pass
-            except Exception as e:
-                errors.append(str(e))
-            return m
-
-        def aux(orig, sauve, n, search_supp):
-            m_copie = 0
-            m_supp = 0
-            try:
-                lo = listdir(orig)
-                ls = listdir(sauve)
-            except Exception as e:
-                errors.append(str(e))
-                lo = []
-                ls = []
-            lo.sort(key=lambda x: x.lower())
-            ls.sort(key=lambda x: x.lower())
-            supp = False
-            copie = False
-            if search_supp:
-                for item in ls:
-                    chemin_s = join(sauve, item)
-                    if chemin_s not in excl_supp and item not in lo:
-                        supp = True
-                        self.tree_supp.insert(sauve, 'end', chemin_s, text=item,
-                                              tags=("whole", ))
-                        m_supp = max(m_supp, int(len(item) * 9 + 20 * (n + 1)),
-                                     arbo(self.tree_supp, chemin_s, n + 1))
-
-            for item in lo:
-                chemin_o = join(orig, item)
-                chemin_s = join(sauve, item)
-                if ((item not in self.exclude_names) and
-                        (splitext(item)[-1] not in self.exclude_ext)):
-                    if item not in ls:
-                        # le dossier / fichier n'est pas dans la sauvegarde
-                        if islink(chemin_o):
-                            if copy_links:
-                                copie = True
-                                self.tree_copie.insert(orig, 'end', chemin_o, text=item,
-                                                       tags=("whole", "link"))
-                                m_copie = max(m_copie, (int(len(item) * 9 + 20 * (n + 1))))
-                        else:
-                            copie = True
-                            self.tree_copie.insert(orig, 'end', chemin_o, text=item,
-                                                   tags=("whole", ))
-                            m_copie = max(m_copie, (int(len(item) * 9 + 20 * (n + 1))),
-                                          arbo(self.tree_copie, chemin_o, n + 1))
-                    elif islink(chemin_o) and exists(chemin_o):
-                        # checking the existence prevent from copying broken links
-                        if copy_links:
-                            if not islink(chemin_s):
-                                self.pb_chemins.append(chemin_o)
-                                tags = ("whole", "warning", "link")
-                            else:
-                                tags = ("whole", "link")
-                            self.tree_copie.insert(orig, 'end', chemin_o, text=item,
-                                                   tags=tags)
-                            m_copie = max(m_copie, int(len(item) * 9 + 20 * (n + 1)))
-                            copie = True
-                    elif isfile(chemin_o):
-                        # first check if chemin_s is also a file
-                        if isfile(chemin_s):
-                            if getmtime(chemin_o) // 60 > getmtime(chemin_s) // 60:
-                                # le fichier f a été modifié depuis la dernière sauvegarde
-                                copie = True
-                                self.tree_copie.insert(orig, 'end', chemin_o, text=item,
-                                                       tags=("whole", ))
-                        else:
-                            self.pb_chemins.append(chemin_o)
-                            self.tree_copie.insert(orig, 'end', chemin_o, text=item,
-                                                   tags=("whole", "warning"))
-                    elif isdir(chemin_o):
-                        # to avoid errors due to unrecognized item types (neither file nor folder nor link)
-                        if isdir(chemin_s):
-                            self.tree_copie.insert(orig, 'end', chemin_o, text=item)
-                            self.tree_supp.insert(sauve, 'end', chemin_s, text=item)
-                            c, s, mc, ms = aux(chemin_o, chemin_s, n + 1,
-                                               search_supp and (chemin_s not in excl_supp))
-                            supp = supp or s
-                            copie = copie or c
-                            if not c:
-                                # nothing to copy
-                                self.tree_copie.delete(chemin_o)
-                            else:
-                                m_copie = max(m_copie, mc, int(len(item) * 9 + 20 * (n + 1)))
-                            if not s:
-                                # nothing to delete
-                                self.tree_supp.delete(chemin_s)
-                            else:
-                                m_supp = max(m_supp, ms, int(len(item) * 9 + 20 * (n + 1)))
-                        else:
-                            copie = True
-                            self.pb_chemins.append(chemin_o)
-                            self.tree_copie.insert(orig, 'end', chemin_o, text=item,
-                                                   tags=("whole", "warning"))
-                            m_copie = max(m_copie, (int(len(item) * 9 + 20 * (n + 1))),
-                                          arbo(self.tree_copie, chemin_o, n + 1))
-            return copie, supp, m_copie, m_supp
-
-        self.tree_copie.insert("", 0, original, text=original,
-                               tags=("checked", ), open=True)
-        self.tree_supp.insert("", 0, sauvegarde, text=sauvegarde,
-                              tags=("checked", ), open=True)
-        c, s, mc, ms = aux(original, sauvegarde, 1, True)
-        if not c:
-            self.tree_copie.delete(original)
-            self.tree_copie.column("#0", minwidth=0, width=0)
-        else:
-            mc = max(len(original) * 9 + 20, mc)
-            self.tree_copie.column("#0", minwidth=mc, width=mc)
-        if not s:
-            self.tree_supp.delete(sauvegarde)
-            self.tree_supp.column("#0", minwidth=0, width=0)
-        else:
-            ms = max(len(sauvegarde) * 9 + 20, mc)
-            self.tree_supp.column("#0", minwidth=ms, width=ms)
-        return errors
+        """
+        Compare original and sauvegarde (run in a separate thread).
+
+        The new entries of the diff are sent by batches to the main loop
+        through q_scan.
+        """
+        def progress(diff, nb_scanned):
+            # the trees only grow, the entries below these numbers are final
+            self.q_scan.put(("batch", nb_scanned, diff, len(diff.copie),
+                             len(diff.supp)))
+
+        self.scanner.progress = progress
+        try:
+            diff = self.scanner.scan(original, sauvegarde)
+            if self.scanner.sizes:
+                # totals of the subtrees, for the confirmation dialog
+                diff.copie.totals()
+                diff.supp.totals()
+        except Exception as e:
+            # e.g. sqlite3.Error from the index: the partial diff cannot be
+            # synchronized, but the GUI must be enabled again
+            diff = Diff(original, sauvegarde)
+            diff.errors.append(_("The scan failed: %(error)s") % {'error': e})
+            diff.cancelled = True
+        self.q_scan.put(("done", diff))
+
+    def display_entries(self, tree, model, n):
+        """
+        Insert the entries of model (DiffTree) up to n in tree. The item
+        identifiers are the indexes of the entries in the model.
+        """
+        start, lazy = self._displayed.get(tree, (0, None))
+        if n == 0 or n < start:
+            return
+        m = self._scan_width.get(tree, 0)
+        names = model.names
+        parents = model.parents
+        depths = model.depths
+        if start == 0:
+            tree.insert("", 0, "0", text=model.root, tags=("checked", ),
+                        open=True)
+            m = max(m, len(model.root) * 9 + 20)
+        # the entries are inserted all at once
+        rows = []
+        placeholders = []
+        for i in range(max(start, 1), n + 1):
+            if lazy is not None:
+                if depths[i] > depths[lazy]:
+                    # the content of new folders is only inserted in the
+                    # tree when they are opened
+                    if i == lazy + 1:
+                        placeholders.append(lazy)
+                    continue
+                lazy = None
+            name = names[i]
+            rows.append((parents[i], i, name, model.tags(i)))
+            m = max(m, len(name) * 9 + 20 * (depths[i] + 1))
+            if model.kind(i) == DIR and model.state(i) != PARTIAL:
+                lazy = i
+        tree.insert_many(rows, placeholders)
+        self._displayed[tree] = (n + 1, lazy)
+        self._scan_width[tree] = m
+        tree.column("#0", minwidth=m, width=m)
+
+    def populate(self, tree, model, item):
+        """Insert the children of item (new folder) in tree."""
+        m = tree.column("#0", "width")
+        depths = model.depths
+        rows = []
+        placeholders = []
+        for i in model.children(int(item)):
+            name = model.names[i]
+            rows.append((item, i, name, model.tags(i)))
+            m = max(m, len(name) * 9 + 20 * (depths[i] + 1))
+            if model.kind(i) == DIR and i + 1 <= len(model) and depths[i + 1] > depths[i]:
+                placeholders.append(i)
+        tree.insert_many(rows, placeholders)
+        tree.column("#0", minwidth=m, width=m)
+
+    def update_scan(self):
+        """Display the scan results sent by the scanning thread."""
+        # limit the number of batches handled at once to keep the GUI responsive
+        for i in range(10):
+            if self.q_scan.empty():
+                break
+            msg = self.q_scan.get()
+            if msg[0] == "batch":
+                nb, diff, n_copie, n_supp = msg[1:]
+                self.display_entries(self.tree_copie, diff.copie, n_copie)
+                self.display_entries(self.tree_supp, diff.supp, n_supp)
+                self.label_scan.configure(text=_("%(nb)i entries scanned") % {'nb': nb})
+            else:
+                self.scan_finished(msg[1])
+                return
+        self.after(50, self.update_scan)
+
+    def cancel_scan(self):
+        """Stop the ongoing scan."""
+        if self.scanner is not None:
+            self.b_cancel_scan.state(("disabled", ))
+            self.scanner.cancel()
 
     def show_warning(self, event):
         if "disabled" not in self.b_open_orig.state():
             x, y = event.x, event.y
             elem = event.widget.identify("element", x, y)
             if elem == "padding":
-                orig = self.tree_copie.identify_row(y)
+                orig = self.diff.copie.path(int(self.tree_copie.identify_row(y)))
                 sauve = orig.replace(self.original, self.sauvegarde)
                 showwarning(_("Warning"),
                             _("%(original)s and %(backup)s are not of the same kind (folder/file/link)") % {'original': orig, 'backup': sauve},
@@ -598,6 +732,9 @@ class Sync(Tk):
 
     def list_files_to_sync(self, event=None):
         """Display in a treeview the file to copy and the one to delete."""
+        if self.scanner is not None:
+            # <Key-Return> still works in the disabled entries
+            return
         self.pbar_copie.configure(value=0)
         self.pbar_supp.configure(value=0)
         self.sauvegarde = self.entry_sauve.get()
@@ -616,47 +753,103 @@ class Sync(Tk):
                     self.menu_recent.delete(9)
                 save_config()
                 self.menu.entryconfigure(0, state="normal")
-                self.configure(cursor="watch")
-                self.toggle_state_gui()
-                self.update_idletasks()
-                self.update()
-                self.efface_tree()
-                err = self.sync(self.original, self.sauvegarde)
-                self.configure(cursor="")
-                self.toggle_state_gui()
-                c = self.tree_copie.get_children("")
-                s = self.tree_supp.get_children("")
-                if not (c or s):
-                    self.menu.entryconfigure(5, state="disabled")
-                    self.b_collapse_copie.state(("disabled", ))
-                    self.b_expand_copie.state(("disabled", ))
-                    self.b_collapse_supp.state(("disabled", ))
-                    self.b_expand_supp.state(("disabled", ))
-                elif not c:
-                    self.b_collapse_copie.state(("disabled", ))
-                    self.b_expand_copie.state(("disabled", ))
-                elif not s:
-                    self.b_collapse_supp.state(("disabled", ))
-                    self.b_expand_supp.state(("disabled", ))
-                if err:
-                    showerror(_("Errors"), "\n".join(err), master=self)
-                notification_send(_("Scan is finished."))
-                warnings = self.tree_copie.tag_has('warning')
-                if warnings:
-                    showwarning(_("Warning"),
-                                _("Some elements to copy (in red) are not of the same kind on the original and the backup."),
-                                master=self)
+                self.start_scan()
             else:
                 showerror(_("Error"), _("Invalid path!"), master=self)
 
-    def efface_tree(self):
-        """Clear both trees."""
+    def start_scan(self, quiet=False):
+        """
+        Start the scan of the current pair in a separate thread.
+
+        quiet: if True (automatic scan of the watch mode), the end of the
+               scan is not notified
+        """
+        if self.scanner is not None:
+            # only one scan at a time
+            return
+        self.start_watch()
+        self._quiet_scan = quiet
+        self.toggle_state_gui()
+        self.efface_tree()
+        self.label_scan.configure(text="")
+        self.b_cancel_scan.state(("!disabled", ))
+        self.b_cancel_scan.grid()
+        self.frame_scan.grid()
+        clean = None
+        if self.watcher is not None:
+            self.watcher.begin_scan()
+            clean = self.watcher.is_clean
+        tolerance = CONFIG.getfloat("Defaults", "mtime_tolerance")
+        comparator = Comparator(self.compare_mode.get(), int(tolerance * 1e9),
+                                HASH_FILE)
+        # the removal exclusions are absolute paths of the backup, the
+        # quarantine is never removed by a synchronization
+        exclude_supp = ExclusionMatcher(self.exclude_supp + [join(self.sauvegarde, TRASH_DIR) + "/"],
+                                        self.sauvegarde)
+        index = None
+        if self.scan_index.get():
+            index = index_file(INDEX_PATH, self.original, self.sauvegarde)
+        # the backup files can be rewritten without changing the mtime of
+        # their folder, the checksum mode must see it
+        self.scanner = Scanner(self.copy_links.get(), self.exclude_copie,
+                               exclude_supp, comparator, index, clean,
+                               sizes=self.show_size.get(),
+                               trust_backup=self.compare_mode.get() != CHECKSUM)
+        self._scan_width.clear()
+        self._displayed.clear()
+        Thread(target=self.sync, name="scan", daemon=True,
+               args=(self.original, self.sauvegarde)).start()
+        self.update_scan()
+
+    def scan_finished(self, diff):
+        """Put the GUI back in normal state once the scan is over."""
+        self.scanner = None
+        self.frame_scan.grid_remove()
+        self.toggle_state_gui()
+        if self.watcher is not None:
+            self.watcher.end_scan(not diff.cancelled)
+        if diff.cancelled:
+            self.efface_tree()
+            self.menu.entryconfigure(5, state="disabled")
+            if diff.errors and not self._quiet_scan:
+                showerror(_("Errors"), "\n".join(diff.errors), master=self)
+            return
+        self.diff = diff
+        self.pb_chemins = diff.copie.conflicts()
+        if not diff.copie:
+            self.tree_copie.column("#0", minwidth=0, width=0)
+        if not diff.supp:
+            self.tree_supp.column("#0", minwidth=0, width=0)
         c = self.tree_copie.get_children("")
-        for item in c:
-            self.tree_copie.delete(item)
         s = self.tree_supp.get_children("")
-        for item in s:
-            self.tree_supp.delete(item)
+        if not (c or s):
+            self.menu.entryconfigure(5, state="disabled")
+            self.b_collapse_copie.state(("disabled", ))
+            self.b_expand_copie.state(("disabled", ))
+            self.b_collapse_supp.state(("disabled", ))
+            self.b_expand_supp.state(("disabled", ))
+        elif not c:
+            self.b_collapse_copie.state(("disabled", ))
+            self.b_expand_copie.state(("disabled", ))
+        elif not s:
+            self.b_collapse_supp.state(("disabled", ))
+            self.b_expand_supp.state(("disabled", ))
+        if self._quiet_scan:
+            return
+        if diff.errors:
+            showerror(_("Errors"), "\n".join(diff.errors), master=self)
+        notification_send(_("Scan is finished."))
+        warnings = self.tree_copie.tag_has('warning')
+        if warnings:
+            showwarning(_("Warning"),
+                        _("Some elements to copy (in red) are not of the same kind on the original and the backup."),
+                        master=self)
+
+    def efface_tree(self):
+        """Clear both trees."""
+        self._edited = False
+        self.tree_copie.clear()
+        self.tree_supp.clear()
         self.b_collapse_copie.state(("disabled", ))
         self.b_expand_copie.state(("disabled", ))
         self.b_collapse_supp.state(("disabled", ))
@@ -689,6 +882,8 @@ class Sync(Tk):
         normal state once both processes are done.
         """
         if not self.is_running_copie and not self.is_running_supp:
+            self.show_progress(self.q_copie, self.pbar_copie, self.label_copie)
+            self.show_progress(self.q_supp, self.pbar_supp, self.label_supp)
             notification_send(_("Sync is finished."))
             self.toggle_state_gui()
             self.pbar_copie.configure(value=self.pbar_copie.cget("maximum"))
@@ -696,6 +891,12 @@ class Sync(Tk):
             self.menu.entryconfigure(5, state="disabled")
             self.configure(cursor="")
             self.efface_tree()
+            self.journal.close(True)
+            self.journal = None
+            self.invalidate_index()
+            if self.watcher is not None:
+                # display what remains to be synchronized
+                self.start_scan(True)
             msg = ""
             if self.err_copie:
                 msg += _("There were errors during the copy, see %(file)s for more details.\n") % {'file': self.log_copie}
@@ -704,29 +905,67 @@ class Sync(Tk):
             if msg:
                 showerror(_("Error"), msg, master=self)
         else:
-            if not self.q_copie.empty():
-                self.pbar_copie.configure(value=self.q_copie.get())
-            if not self.q_supp.empty():
-                self.pbar_supp.configure(value=self.q_supp.get())
+            self.show_progress(self.q_copie, self.pbar_copie, self.label_copie)
+            self.show_progress(self.q_supp, self.pbar_supp, self.label_supp)
             self.update()
             self.after(50, self.update_pbar)
 
+    def show_progress(self, queue, pbar, label):
+        """
+        Display the progress sent through queue: the bar follows the bytes
+        (or the files if there are only empty files) and the label shows
+        the files, bytes, throughput and remaining time.
+        """
+        state = self._progress[pbar]
+        done = None
+        # only the last values sent matter
+        while not queue.empty():
+            msg = queue.get()
+            if msg[0] == "total":
+                state["total"] = msg[1:]
+                pbar.configure(maximum=max(msg[2] or msg[1], 1))
+            else:
+                done = msg[1:]
+        if done is None or "total" not in state:
+            return
+        files, size = done
+        total_files, total_size = state["total"]
+        pbar.configure(value=size if total_size else files)
+        rate = state["throughput"].update(size)
+        eta = Throughput.eta(total_size - size, rate)
+        text = _("%(files)i/%(total_files)i files, %(size)s/%(total_size)s") % {'files': files, 'total_files': total_files, 'size': convert_size(size), 'total_size': convert_size(total_size)}
+        if rate > 0:
+            text += _(", %(rate)s/s") % {'rate': convert_size(rate)}
+        if eta is not None and size < total_size:
+            text += _(", %(eta)s left") % {'eta': format_duration(eta)}
+        label.configure(text=text)
+
     @staticmethod
-    def get_list(tree):
-        """Return the list of files/folders to copy/delete (depending on the tree)."""
-        selected = []
+    def log_summary(logger, progress, action):
+        """Write the totals of progress (Progress) in the log."""
+        files, size, duration, rate = progress.summary()
+        logger.info(_("%(action)s: %(files)i files, %(size)s in %(duration)s (%(rate)s/s)") % {'action': action, 'files': files, 'size': convert_size(size), 'duration': format_duration(duration), 'rate': convert_size(rate)})
+
+    @staticmethod
+    def get_list(tree, model, sizes=None):
+        """
+        Return the list of files/folders to copy/delete (depending on the
+        tree, model being the corresponding DiffTree).
 
-        def aux(item):
-            tags = tree.item(item, "tags")
-            if "checked" in tags and "whole" in tags:
-                selected.append(item)
-            elif "checked" in tags or "tristate" in tags:
-                ch = tree.get_children(item)
-                for c in ch:
-                    aux(c)
-        ch = tree.get_children("")
-        for c in ch:
-            aux(c)
+        sizes: if given, the (number of files, size) of the selected paths
+               recorded by the scan are stored in it
+        """
+        selected = []
+        # the selection stops at the new / modified entries, it goes on in
+        # the content of the checked folders that are partially copied
+        items = tree.get_checked(lambda item: model.state(int(item)) != PARTIAL)
+        for i in sorted(map(int, items)):
+            path = model.path(i)
+            selected.append(path)
+            if sizes is not None:
+                total = model.total(i)
+                if total is not None:
+                    sizes[path] = total
         return selected
 
     def synchronise(self):
@@ -735,91 +974,222 @@ class Sync(Tk):
         and launch the copy and deletion if the user validates the sync.
         """
         # get files to delete and folder to delete if they are empty
-        a_supp = self.get_list(self.tree_supp)
+        # sizes recorded by the scan
+        sizes = {} if self.show_size.get() else None
+        a_supp = self.get_list(self.tree_supp, self.diff.supp, sizes)
         # get files to copy
-        a_copier = self.get_list(self.tree_copie)
+        a_copier = self.get_list(self.tree_copie, self.diff.copie, sizes)
         a_supp_avant_cp = []
+        copied = set(a_copier)
         for ch in self.pb_chemins:
-            if ch in a_copier:
+            if ch in copied:
                 a_supp_avant_cp.append(ch.replace(self.original, self.sauvegarde))
         if a_supp or a_copier:
-            Confirmation(self, a_copier, a_supp, a_supp_avant_cp, self.original, self.sauvegarde, self.show_size.get())
+            Confirmation(self, a_copier, a_supp, a_supp_avant_cp, self.original, self.sauvegarde, self.show_size.get(), sizes)
+
+    def invalidate_index(self):
+        """Remove the folders modified by the last sync from the scan index."""
+        a_copier, a_supp = self._synced
+        index = ScanIndex(index_file(INDEX_PATH, self.original, self.sauvegarde))
+        index.invalidate(SAUVEGARDE, [relpath(ch, self.original) for ch in a_copier])
+        index.invalidate(SAUVEGARDE, [relpath(ch, self.sauvegarde) for ch in a_supp])
+        index.close()
+
+    def copie_supp(self, a_copier, a_supp, a_supp_avant_cp, sizes=None,
+                   resume=False):
+        """
+        Launch sync.
 
-    def copie_supp(self, a_copier, a_supp, a_supp_avant_cp):
-        """Launch sync."""
+        sizes: path -> (number of files, size) of the paths of a_copier and
+               a_supp whose size is already known
+        resume: whether an interrupted synchronization is resumed, the
+                files already copied are then skipped
+        """
+        if sizes is None:
+            sizes = {}
+        self._synced = (a_copier, a_supp)
+        # the operations are recorded in a journal until they are done so
+        # that the sync can be resumed if it is interrupted
+        self.journal = Journal(journal_file(JOURNAL_PATH, self.original,
+                                            self.sauvegarde))
+        self.journal.start(self.original, self.sauvegarde, a_copier, a_supp,
+                           a_supp_avant_cp)
         self.toggle_state_gui()
         self.configure(cursor="watch")
         self.update()
         self.pbar_copie.state(("!disabled", ))
         self.pbar_supp.state(("!disabled", ))
-        nbtot_copie = len(a_copier) + len(a_supp_avant_cp)
-        self.pbar_copie.configure(maximum=nbtot_copie, value=0)
-        nbtot_supp = len(a_supp)
-        self.pbar_supp.configure(maximum=nbtot_supp, value=0)
+        # the totals are sent by the threads
+        self.pbar_copie.configure(maximum=1, value=0)
+        self.pbar_supp.configure(maximum=1, value=0)
+        self.label_copie.configure(text="")
+        self.label_supp.configure(text="")
+        self._progress = {self.pbar_copie: {"throughput": Throughput()},
+                          self.pbar_supp: {"throughput": Throughput()}}
+        # the copy and the removal share the throughput limits
+        self.throttle = Throttle(CONFIG.getfloat("Defaults", "limit_rate") * 1024 * 1024,
+                                 CONFIG.getfloat("Defaults", "limit_files"),
+                                 self.adaptive.get(), self.low_priority.get()) or None
+        # shared by the copy (removal before copy) and the removal
+        self._quarantine = Quarantine(abspath(self.sauvegarde),
+                                      self.logger_supp, self.throttle)
         self.is_running_copie = True
         self.is_running_supp = True
         process_copie = Thread(target=self.copie, name="copie", daemon=True,
-                               args=(a_copier, a_supp_avant_cp))
+                               args=(a_copier, a_supp_avant_cp, sizes, resume))
         process_supp = Thread(target=self.supp, daemon=True,
-                              name="suppression", args=(a_supp, ))
+                              name="suppression", args=(a_supp, sizes))
         process_copie.start()
         process_supp.start()
         self.pbar_copie.configure(value=0)
         self.pbar_supp.configure(value=0)
         self.update_pbar()
 
-    def copie(self, a_copier, a_supp_avant_cp):
+    @staticmethod
+    def get_sizes(paths, sizes):
+        """
+        Return the (number of files, size) of each path, using the ones in
+        sizes when they are known.
+        """
+        res = []
+        for path in paths:
+            if path not in sizes:
+                try:
+                    sizes[path] = tree_size(path)
+                except OSError:
+                    sizes[path] = (0, 0)
+            res.append(sizes[path])
+        return res
+
+    def copie(self, a_copier, a_supp_avant_cp, sizes, resume=False):
         """
         Copie tous les fichiers/dossiers de a_copier de original vers
-        sauvegarde en utilisant la commande système cp. Les erreurs
+        sauvegarde (équivalent de cp -a --parents). Les erreurs
         rencontrées au cours du processus sont inscrites dans
         ~/.foldersync/copie.log
         """
         self.err_copie = False
+        try:
+            self._copie(a_copier, a_supp_avant_cp, sizes, resume)
+        except Exception:
+            # e.g. an error writing the journal: the GUI must be enabled
+            # again
+            self.logger_copie.exception(_("The copy failed:"))
+            self.err_copie = True
+        finally:
+            self.is_running_copie = False
+
+    def _copie(self, a_copier, a_supp_avant_cp, sizes, resume):
         orig = abspath(self.original) + "/"
         sauve = abspath(self.sauvegarde) + "/"
-        chdir(orig)
+        progress = Progress(self.q_copie)
+        durability = Durability(self.fsync.get(),
+                                CONFIG.getint("Defaults", "fsync_batch_files"),
+                                CONFIG.getint("Defaults", "fsync_batch_size") * 1024 * 1024)
+        delta_size = 0
+        if self.delta.get():
+            delta_size = CONFIG.getint("Defaults", "delta_size") * 1024 * 1024
+        if self.throttle is not None:
+            self.throttle.started()
+        copier = Copier(orig, sauve, self.logger_copie, progress, resume,
+                        durability, delta_size, self.throttle)
+        # the entries removed before the copy count as one file each
+        total = self.get_sizes(a_copier, sizes)
+        progress.set_total(sum(s[0] for s in total) + len(a_supp_avant_cp),
+                           sum(s[1] for s in total))
         self.logger_copie.info(_("\n###### Copy: %(original)s -> %(backup)s\n") % {'original': self.original, 'backup': self.sauvegarde})
-        n = len(a_supp_avant_cp)
         self.logger_copie.info(_("Removal before copy:"))
-        for i, ch in zip(range(1, n + 1), a_supp_avant_cp):
-            self.logger_copie.info(ch)
-            p_copie = run(["rm", "-r", ch], stderr=PIPE)
-            self.q_copie.put(i)
-            err = p_copie.stderr.decode()
-            if err:
+
+        def removed(i):
+            self.journal.mark_done(SUPP_AVANT_CP, i)
+            progress.add(1)
+
+        indexes = list(range(len(a_supp_avant_cp)))
+        if self.quarantine.get():
+            # the replaced entries are kept in the quarantine too
+            indexes, nb_errors = self._quarantine.move_all(a_supp_avant_cp,
+                                                           self.logger_copie,
+                                                           removed)
+            if nb_errors:
                 self.err_copie = True
-                self.logger_copie.error(err.strip())
+        remover = Remover(self.logger_copie,
+                          CONFIG.getint("Defaults", "copy_workers"),
+                          CONFIG.getint("Defaults", "copy_workers_hdd"),
+                          lambda k: removed(indexes[k]), self.throttle)
+        if remover.run([a_supp_avant_cp[i] for i in indexes],
+                       self.logger_copie.info):
+            self.err_copie = True
         self.logger_copie.info(_("Copy:"))
-        for i, ch in zip(range(n + 1, n + 1 + len(a_copier)), a_copier):
-            ch_o = ch.replace(orig, "")
-            self.logger_copie.info("%s -> %s" % (ch_o, sauve))
-            p_copie = run(["cp", "-ra", "--parents", ch_o, sauve], stderr=PIPE)
-            self.q_copie.put(i)
-            err = p_copie.stderr.decode()
-            if err:
-                self.err_copie = True
-                self.logger_copie.error(err.strip())
-        self.is_running_copie = False
+        # the files are copied by a pool of workers (in parallel, except on
+        # spinning disks), the copier reports the progress in q_copie
+        pool = CopyPool(copier, CONFIG.getint("Defaults", "copy_workers"),
+                        CONFIG.getint("Defaults", "copy_workers_hdd"),
+                        CONFIG.getint("Defaults", "large_file_size") * 1024 * 1024,
+                        lambda i: self.journal.mark_done(COPIE, i))
+        pool.run(a_copier,
+                 lambda ch: self.logger_copie.info("%s -> %s" % (ch.replace(orig, ""), sauve)))
+        progress.flush()
+        self.log_summary(self.logger_copie, progress, _("Copy"))
+        self.logger_copie.info(_("%(cloned)s cloned, %(copied)s copied") % {'cloned': convert_size(copier.cloned), 'copied': convert_size(copier.copied)})
+        if copier.saved:
+            self.logger_copie.info(_("%(saved)s saved by the delta transfer") % {'saved': convert_size(copier.saved)})
+        if copier.nb_errors:
+            self.err_copie = True
 
-    def supp(self, a_supp):
+    def supp(self, a_supp, sizes):
         """
         Supprime tous les fichiers/dossiers de a_supp de original vers
-        sauvegarde en utilisant la commande système rm. Les erreurs
+        sauvegarde (équivalent de rm -r). Les erreurs
         rencontrées au cours du processus sont inscrites dans
         ~/.foldersync/suppression.log.
         """
         self.err_supp = False
+        try:
+            self._supp(a_supp, sizes)
+        except Exception:
+            self.logger_supp.exception(_("The removal failed:"))
+            self.err_supp = True
+        finally:
+            self.is_running_supp = False
+
+    def _supp(self, a_supp, sizes):
         self.logger_supp.info(_("\n###### Removal:  %(original)s -> %(backup)s\n") % {'original': self.original, 'backup': self.sauvegarde})
-        for i, ch in enumerate(a_supp):
-            self.logger_supp.info(ch)
-            p_supp = run(["rm", "-r", ch], stderr=PIPE)
-            self.q_supp.put(i + 1)
-            err = p_supp.stderr.decode()
-            if err:
-                self.logger_supp.error(err.strip())
+        progress = Progress(self.q_supp)
+        total = self.get_sizes(a_supp, sizes)
+        progress.set_total(sum(s[0] for s in total), sum(s[1] for s in total))
+
+        def removed(i):
+            self.journal.mark_done(SUPP, i)
+
+        def moved(i):
+            removed(i)
+            progress.add(*total[i])
+
+        if self.throttle is not None:
+            self.throttle.started()
+        workers = CONFIG.getint("Defaults", "copy_workers")
+        quarantine = self._quarantine
+        indexes = list(range(len(a_supp)))
+        if self.quarantine.get():
+            # the entries are renamed into the quarantine, only the ones
+            # on another filesystem are actually removed
+            indexes, nb_errors = quarantine.move_all(a_supp, self.logger_supp,
+                                                     moved)
+            if nb_errors:
                 self.err_supp = True
-        self.is_running_supp = False
+        # the trees are removed in process by a pool of workers, which
+        # report the progress file by file
+        remover = Remover(self.logger_supp, workers,
+                          CONFIG.getint("Defaults", "copy_workers_hdd"),
+                          lambda k: removed(indexes[k]), self.throttle,
+                          progress)
+        if remover.run([a_supp[i] for i in indexes], self.logger_supp.info):
+            self.err_supp = True
+        progress.flush()
+        self.log_summary(self.logger_supp, progress, _("Removal"))
+        # the old quarantine folders are purged in the background
+        Thread(target=quarantine.purge, daemon=True,
+               args=(CONFIG.getint("Defaults", "quarantine_days"), workers)).start()
 
     def unlink(self):
         """Unlink pidfile."""
@@ -0,0 +1,167 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+FolderSync - Folder synchronization software
+Copyright 2017-2018 Juliette Monsel <j_4321@protonmail.com>
+
+FolderSync is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FolderSync is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Throttling of the copy and removal workers: bandwidth limits, low priority
+and adaptive back-off
+"""
+
+import ctypes
+import os
+import platform
+from threading import Lock, local, get_native_id
+from time import monotonic, sleep
+
+# ioprio_set system call number
+SYS_IOPRIO_SET = {"x86_64": 251, "i386": 289, "i686": 289, "aarch64": 30,
+                  "armv7l": 314, "ppc64le": 273, "s390x": 282}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_SHIFT = 13
+
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+    _syscall = _libc.syscall
+    _sys_ioprio_set = SYS_IOPRIO_SET[platform.machine()]
+    IOPRIO = True
+except (OSError, AttributeError, KeyError):
+    IOPRIO = False
+
+# the limits allow bursts of that many seconds
+BURST = 0.2
+# the adaptive mode adjusts the rate every ADAPT_INTERVAL seconds, it backs
+# off when the latency of the operations exceeds BACK_OFF times the usual one
+ADAPT_INTERVAL = 1
+BACK_OFF = 2
+MIN_RATE = 1024 * 1024
+# unit of the latency: the time to handle one MB (but at least one operation
+# of 64 kB), so that small and large files can be compared
+LATENCY_UNIT = 1024 * 1024
+MIN_OPERATION = 64 * 1024
+
+
+def set_low_priority():
+    """
+    Give the lowest CPU priority and the lowest best-effort I/O priority
+    to the calling thread (the idle I/O class could starve the copy
+    forever on a busy server).
+    """
+    tid = get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, 19)
+    except OSError:
+        pass
+    if IOPRIO:
+        _syscall(_sys_ioprio_set, IOPRIO_WHO_PROCESS, tid,
+                 (IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT) | 7)
+
+
+class Throttle:
+    """
+    Throughput limits shared by the copy and removal workers.
+
+    The workers call started() when they start and consume() after each
+    operation, which sleeps as long as needed to respect the limits.
+
+    max_rate: maximum throughput in bytes/s (0: no limit)
+    max_files: maximum number of files handled per second (0: no limit)
+    adaptive: lower the throughput when the operations take longer than
+              usual (disk busy with other processes), then raise it back
+              progressively up to max_rate
+    low_priority: the workers get the lowest CPU and I/O priority
+    """
+
+    def __init__(self, max_rate=0, max_files=0, adaptive=False,
+                 low_priority=False):
+        self.max_rate = max_rate
+        self.max_files = max_files
+        self.adaptive = adaptive
+        self.low_priority = low_priority
+        self.rate = max_rate  # current limit, 0 if none
+        self._next_size = 0   # time when the bytes already handled are paid
+        self._next_files = 0
+        self._lock = Lock()
+        self._local = local()
+        # adaptive mode
+        self._period = monotonic()
+        self._period_size = 0
+        self._latencies = 0
+        self._operations = 0
+        self._baseline = None
+        self._peak = 0  # throughput before backing off without max_rate
+
+    def __bool__(self):
+        return bool(self.max_rate or self.max_files or self.adaptive or
+                    self.low_priority)
+
+    def started(self):
+        """Called from each worker when it starts."""
+        if self.low_priority:
+            set_low_priority()
+        self._local.last = monotonic()
+
+    def consume(self, files=0, size=0):
+        """Record an operation and wait if it exceeds the limits."""
+        now = monotonic()
+        wait = 0
+        with self._lock:
+            if self.adaptive:
+                self._measure(now, size)
+            if size and self.rate:
+                self._next_size = max(self._next_size, now - BURST) + size / self.rate
+                wait = self._next_size - now
+            if files and self.max_files:
+                self._next_files = max(self._next_files, now - BURST) + files / self.max_files
+                wait = max(wait, self._next_files - now)
+        if wait > 0:
+            sleep(wait)
+        self._local.last = monotonic()
+
+    def _measure(self, now, size):
+        """Adapt the rate to the latency of the operations (lock held)."""
+        last = getattr(self._local, "last", now)
+        self._latencies += (now - last) * LATENCY_UNIT / max(size, MIN_OPERATION)
+        self._operations += 1
+        self._period_size += size
+        duration = now - self._period
+        if duration < ADAPT_INTERVAL:
+            return
+        latency = self._latencies / self._operations
+        rate = self._period_size / duration
+        self._period = now
+        self._period_size = 0
+        self._latencies = 0
+        self._operations = 0
+        if self._baseline is None:
+            self._baseline = latency
+            return
+        if latency > BACK_OFF * self._baseline:
+            # the disk is slower than usual: halve the throughput
+            if not self.rate:
+                self._peak = rate
+            self.rate = max(MIN_RATE, rate / 2)
+        else:
+            # the usual latency can rise slowly (e.g. different files)
+            self._baseline = min(latency, self._baseline * 1.05)
+            if self.rate:
+                self.rate *= 1.25
+                if self.max_rate:
+                    self.rate = min(self.rate, self.max_rate)
+                elif self.rate >= self._peak:
+                    # back to the throughput reached without limit
+                    self.rate = 0
@@ -0,0 +1,103 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+FolderSync - Folder synchronization software
+Copyright 2017-2018 Juliette Monsel <j_4321@protonmail.com>
+
+FolderSync is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FolderSync is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+List widget for millions of rows
+"""
+
+
+from tkinter import Listbox
+from tkinter.font import nametofont
+from tkinter.ttk import Frame
+from foldersynclib.scrollbar import AutoScrollbar as Scrollbar
+
+
+class VirtualList(Frame):
+    """
+    List of text rows that only inserts the visible rows in the underlying
+    Listbox, so that displaying or scrolling millions of rows costs the
+    same as a screenful.
+
+    rows: sequence of strings (it is not copied)
+    """
+
+    def __init__(self, master=None, rows=(), **kw):
+        Frame.__init__(self, master, **kw)
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+        self._rows = rows
+        self._first = 0
+        self._visible = 1
+        self.listbox = Listbox(self, height=1, activestyle="none",
+                               highlightthickness=0, relief="flat")
+        self.listbox.grid(row=0, column=0, sticky="eswn")
+        self._scrolly = Scrollbar(self, orient="vertical", command=self.yview)
+        self._scrollx = Scrollbar(self, orient="horizontal",
+                                  command=self.listbox.xview)
+        self._scrolly.grid(row=0, column=1, sticky="ns")
+        self._scrollx.grid(row=1, column=0, sticky="ew")
+        self.listbox.configure(xscrollcommand=self._scrollx.set)
+        font = nametofont(self.listbox.cget("font"))
+        self._row_height = font.metrics("linespace") + 1
+        self.listbox.bind("<Configure>", self._on_configure)
+        self.listbox.bind("<MouseWheel>", self._on_wheel)
+        self.listbox.bind("<4>", lambda e: self.yview("scroll", -3, "units"))
+        self.listbox.bind("<5>", lambda e: self.yview("scroll", 3, "units"))
+        for key, n, what in (("<Up>", -1, "units"), ("<Down>", 1, "units"),
+                             ("<Prior>", -1, "pages"), ("<Next>", 1, "pages")):
+            self.listbox.bind(key, lambda e, n=n, what=what: self.yview("scroll", n, what) or "break")
+        self.listbox.bind("<Home>", lambda e: self.yview("moveto", 0) or "break")
+        self.listbox.bind("<End>", lambda e: self.yview("moveto", 1) or "break")
+
+    def set_rows(self, rows, keep_position=False):
+        """Display rows instead of the current ones."""
+        self._rows = rows
+        if not keep_position:
+            self._first = 0
+        self._render()
+
+    def _on_configure(self, event):
+        self._visible = max(1, event.height // self._row_height)
+        self._render()
+
+    def _on_wheel(self, event):
+        self.yview("scroll", -3 if event.delta > 0 else 3, "units")
+
+    def yview(self, *args):
+        """Scrollbar command."""
+        n = len(self._rows)
+        if args[0] == "moveto":
+            self._first = int(float(args[1]) * n)
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if args[2] == "pages":
+                step *= self._visible
+            self._first += step
+        self._render()
+
+    def _render(self):
+        n = len(self._rows)
+        self._first = max(0, min(self._first, n - self._visible))
+        end = min(n, self._first + self._visible)
+        self.listbox.delete(0, "end")
+        if end > self._first:
+            self.listbox.insert(0, *self._rows[self._first:end])
+        if n:
+            self._scrolly.set(self._first / n, end / n)
+        else:
+            self._scrolly.set(0, 1)
@@ -0,0 +1,321 @@
+#! /usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+FolderSync - Folder synchronization software
+Copyright 2017-2018 Juliette Monsel <j_4321@protonmail.com>
+
+FolderSync is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FolderSync is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Watch mode: follow the changes in the original folder with inotify so that
+the next scan only lists the folders that changed.
+"""
+
+import os
+import struct
+from ctypes import CDLL, get_errno
+from ctypes.util import find_library
+from selectors import DefaultSelector, EVENT_READ
+from threading import Thread, Lock
+from time import monotonic
+
+try:
+    _libc = CDLL(find_library("c") or "libc.so.6", use_errno=True)
+    _libc.inotify_init1
+    _libc.inotify_add_watch
+    INOTIFY = True
+except (OSError, AttributeError):
+    INOTIFY = False
+
+# --- inotify constants (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+              IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+              IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+
+EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """Minimal inotify instance."""
+
+    def __init__(self):
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path):
+        """Watch folder path and return the watch descriptor."""
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            errno = get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def read(self):
+        """Return the list of pending (wd, mask, name) events."""
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        i = 0
+        while i < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, i)
+            i += EVENT.size
+            name = os.fsdecode(data[i:i + length].rstrip(b"\0"))
+            i += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """
+    Follow the changes in the folders of root.
+
+    The folders whose content changed are recorded, by path relative to
+    root, until the next scan. Each subfolder of root is watched by its own
+    inotify instance, so that when the event queue of an instance overflows,
+    only this subtree has to be scanned entirely again.
+
+    callback: function called (from the watching thread) when a change is
+              detected
+    """
+
+    def __init__(self, root, callback=None):
+        self.root = root
+        self.callback = callback
+        self._lock = Lock()
+        self._selector = DefaultSelector()
+        self._groups = {}     # top-level folder -> Inotify
+        self._watches = {}    # (Inotify, wd) -> relative path
+        # changes since the start of the current scan: folders whose content
+        # changed and subtrees that have to be scanned entirely
+        self._dirty = set()
+        self._dirty_trees = set()
+        # changes between the start of the previous scan and the current one
+        self._checked = set()
+        self._checked_trees = set()
+        self._unwatched = set()  # subtrees that could not be watched
+        self._ready = False      # all the watches have been set up
+        self._baseline = False   # the previous scan started when ready
+        self._trusted = False    # whether is_clean can return True
+        self.last_event = 0
+        self.nb_changes = 0
+        self._stop_r, self._stop_w = os.pipe()
+        self._thread = Thread(target=self._run, name="watch", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching (can be called from another thread)."""
+        os.write(self._stop_w, b"x")
+
+    # --- state
+    def begin_scan(self):
+        """
+        Called when a scan starts: is_clean() will tell whether a folder
+        changed since the start of the previous scan.
+        """
+        with self._lock:
+            self._trusted = self._baseline
+            self._baseline = self._ready
+            self._checked = self._dirty
+            self._checked_trees = self._dirty_trees
+            self._dirty = set()
+            self._dirty_trees = set()
+            self.nb_changes = 0
+
+    def end_scan(self, complete):
+        """
+        Called when a scan ends: if it did not complete, the changes it
+        should have taken into account are kept for the next one.
+        """
+        with self._lock:
+            if not complete:
+                self._dirty |= self._checked
+                self._dirty_trees |= self._checked_trees
+                self._baseline = self._trusted
+            self._checked = set()
+            self._checked_trees = set()
+
+    def is_clean(self, rel):
+        """
+        Return True if folder rel (relative to root) did not change since
+        the start of the previous scan.
+        """
+        with self._lock:
+            if not self._trusted:
+                return False
+            if rel in self._dirty or rel in self._checked:
+                return False
+            trees = (self._dirty_trees, self._checked_trees, self._unwatched)
+            while True:
+                if any(rel in t for t in trees):
+                    return False
+                if not rel:
+                    return True
+                rel = rel.rpartition("/")[0]
+
+    def _mark(self, rel, tree=False):
+        with self._lock:
+            if tree:
+                self._dirty_trees.add(rel)
+            else:
+                self._dirty.add(rel)
+            self.last_event = monotonic()
+            self.nb_changes += 1
+        if self.callback is not None:
+            self.callback()
+
+    # --- watches
+    def _group(self, top):
+        """Return the inotify instance watching subtree top."""
+        inotify = self._groups.get(top)
+        if inotify is None:
+            try:
+                inotify = Inotify()
+            except OSError:
+                # too many inotify instances: share the one of root
+                inotify = self._groups[""]
+            else:
+                self._selector.register(inotify.fd, EVENT_READ, inotify)
+            self._groups[top] = inotify
+        return inotify
+
+    def _watch(self, inotify, path, rel):
+        try:
+            wd = inotify.add_watch(path)
+        except OSError:
+            # e.g. the maximum number of watches is reached
+            with self._lock:
+                self._unwatched.add(rel)
+            return False
+        self._watches[inotify, wd] = rel
+        return True
+
+    def _watch_tree(self, rel):
+        """Watch folder rel and its subfolders."""
+        top = rel.partition("/")[0]
+        inotify = self._group(top)
+        stack = [rel]
+        while stack:
+            rel = stack.pop()
+            path = os.path.join(self.root, rel)
+            if not self._watch(inotify, path, rel):
+                continue
+            try:
+                with os.scandir(path) as content:
+                    for item in content:
+                        if item.is_dir(follow_symlinks=False):
+                            stack.append(os.path.join(rel, item.name))
+            except OSError:
+                pass
+
+    def _watch_new_tops(self):
+        """Watch the subfolders of root that are not watched yet."""
+        with os.scandir(self.root) as content:
+            tops = [item.name for item in content
+                    if item.is_dir(follow_symlinks=False)]
+        for top in tops:
+            if top not in self._groups:
+                self._mark(top, True)
+                self._watch_tree(top)
+
+    def _setup(self):
+        root = self._group("")
+        self._watch(root, self.root, "")
+        with os.scandir(self.root) as content:
+            tops = [item.name for item in content
+                    if item.is_dir(follow_symlinks=False)]
+        for top in tops:
+            self._watch_tree(top)
+        with self._lock:
+            self._ready = True
+
+    def _close_group(self, top):
+        inotify = self._groups.pop(top, None)
+        if inotify is not None and inotify not in self._groups.values():
+            self._selector.unregister(inotify.fd)
+            inotify.close()
+            for key in [k for k in self._watches if k[0] is inotify]:
+                del self._watches[key]
+
+    def _handle(self, inotify, events):
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                # some events were lost: scan the whole subtree again and
+                # watch the folders that may have been created meanwhile
+                for top in [t for t, i in self._groups.items() if i is inotify]:
+                    if top:
+                        self._mark(top, True)
+                        self._watch_tree(top)
+                    else:
+                        # only the content of root itself is concerned
+                        self._mark("")
+                        self._watch_new_tops()
+                continue
+            rel = self._watches.get((inotify, wd))
+            if rel is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._watches[inotify, wd]
+                if rel and "/" not in rel:
+                    # a top-level folder was removed
+                    self._close_group(rel)
+                continue
+            self._mark(rel)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                child = os.path.join(rel, name)
+                self._mark(child, True)
+                self._watch_tree(child)
+
+    def _run(self):
+        self._selector.register(self._stop_r, EVENT_READ, None)
+        try:
+            self._setup()
+        except OSError:
+            with self._lock:
+                self._unwatched.add("")
+        while True:
+            for key, mask in self._selector.select():
+                if key.data is None:
+                    for inotify in set(self._groups.values()):
+                        inotify.close()
+                    self._selector.close()
+                    os.close(self._stop_r)
+                    os.close(self._stop_w)
+                    return
+                self._handle(key.data, key.data.read())